@@ -4,26 +4,52 @@ from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import HTTPException
 from werkzeug.middleware.proxy_fix import ProxyFix
 import logging
-from validators import validar_identificador, limpiar_y_elegir_telefono, validar_email_Regex
+from validators import validar_dataframe, configurar_caches, guardar_caches, estadisticas_caches
+from reports import ReportWriter, available_formats, report_filename, read_report
+from csv_loader import read_csv_chunks
 import uuid
+import hashlib
+import importlib.util
 from datetime import datetime
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
 import pymysql
-from pymysql.cursors import DictCursor
+from jobs import JobRunner
+from db import open_database_connection
+from db_pool import ConnectionPool, PoolError
+from pipeline import Pipeline
+from snapshot import ImportSnapshot
+from job_store import JobStore
+from retention import RetentionManager
+from upload_stream import UploadStream, UploadAborted, iter_request_file, save_upload
+from user_index import UserIndex
+from dedup import DEDUP_RULES, Deduplicator, dni_keys
+from downloads import OFFLOAD_MODES, send_download
 import threading
+import atexit
+import metrics
+import tempfile
+import zipfile
 
 # Configure logging
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper())
+
+# Sampled row trace: logs what validation did with one of every ROW_TRACE_SAMPLE rows (0 = off)
+ROW_TRACE_SAMPLE = int(os.getenv('ROW_TRACE_SAMPLE', 0))
+trace_logger = logging.getLogger('row_trace')
+if ROW_TRACE_SAMPLE > 0:
+    trace_logger.setLevel(logging.INFO)
 
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "default_secret_key_for_dev")
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
-progress = {}
-
 # Configuration
 UPLOAD_FOLDER = 'static/uploads'
 DOWNLOAD_FOLDER = 'static/downloads'
@@ -31,218 +57,753 @@ ALLOWED_EXTENSIONS = {'csv'}
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['DOWNLOAD_FOLDER'] = DOWNLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_UPLOAD_MB', 1024)) * 1024 * 1024  # max file size
+app.config['JOB_WORKERS'] = int(os.getenv('JOB_WORKERS', 2))  # concurrent imports
+app.config['JOB_QUEUE_SIZE'] = int(os.getenv('JOB_QUEUE_SIZE', 8))  # imports waiting for a worker
+app.config['CSV_CHUNK_SIZE'] = int(os.getenv('CSV_CHUNK_SIZE', 20000))  # rows read, validated and written at a time
+app.config['DB_WORKERS'] = int(os.getenv('DB_WORKERS', 1))  # DB writer threads per import, one connection each
+app.config['DB_BATCH_SIZE'] = int(os.getenv('DB_BATCH_SIZE', 1000))  # users per transaction; bounds how long rows stay locked
+app.config['USER_INDEX'] = os.getenv('USER_INDEX', '0') == '1'  # plan DB writes from an in-memory copy of wp_users
+app.config['USER_INDEX_MAX_AGE'] = int(os.getenv('USER_INDEX_MAX_AGE', 900))  # seconds before the copy is fully reloaded
+app.config['VALIDATION_WORKERS'] = int(os.getenv('VALIDATION_WORKERS', 1))  # validation processes per import (1 = in-process)
+app.config['PIPELINE_QUEUE_SIZE'] = int(os.getenv('PIPELINE_QUEUE_SIZE', 4))  # chunks buffered between stages
+app.config['VALIDATION_CACHE_SIZE'] = int(os.getenv('VALIDATION_CACHE_SIZE', 100000))  # entries per validator cache (0 = off)
+app.config['VALIDATION_CACHE_PATH'] = os.getenv('VALIDATION_CACHE_PATH')  # optional file that keeps the caches between imports
+app.config['SNAPSHOT_PATH'] = os.getenv('SNAPSHOT_PATH', 'import_snapshot.db')  # what previous imports wrote, for incremental mode
+app.config['REPORT_FORMAT'] = os.getenv('REPORT_FORMAT', 'csv')  # default report format: csv, csv.gz, csv.zst or parquet
+app.config['CSV_ENGINE'] = os.getenv('CSV_ENGINE', 'auto')  # auto (pyarrow when installed) or pandas
+app.config['JOB_STORE_PATH'] = os.getenv('JOB_STORE_PATH', 'import_jobs.db')  # imports, checkpoints and results
+app.config['JOB_HISTORY_DAYS'] = int(os.getenv('JOB_HISTORY_DAYS', 7))  # how long finished imports stay in the job store
+app.config['DEDUP_RULE'] = os.getenv('DEDUP_RULE', 'last')  # row written for a repeated DNI: first, last or most_complete
+app.config['REPORT_MAX_AGE_DAYS'] = int(os.getenv('REPORT_MAX_AGE_DAYS', 7))  # reports of older imports are deleted (0 = keep)
+app.config['REPORT_MAX_MB'] = int(os.getenv('REPORT_MAX_MB', 0))  # total size of kept reports; oldest go first (0 = no limit)
+app.config['REPORT_MAX_JOB_MB'] = int(os.getenv('REPORT_MAX_JOB_MB', 0))  # reports kept per import; largest go first (0 = no limit)
+app.config['REPORT_INDEX_PATH'] = os.getenv('REPORT_INDEX_PATH', 'import_reports.db')  # index of the files in DOWNLOAD_FOLDER
+app.config['RETENTION_INTERVAL'] = int(os.getenv('RETENTION_INTERVAL', 3600))  # seconds between report cleanups
+app.config['DOWNLOAD_MAX_AGE'] = int(os.getenv('DOWNLOAD_MAX_AGE', 0))  # seconds browsers reuse a report without asking (0 = revalidate)
+app.config['DOWNLOAD_OFFLOAD'] = os.getenv('DOWNLOAD_OFFLOAD', '')  # '', x-sendfile or x-accel: let the proxy send reports
+app.config['DOWNLOAD_ACCEL_PREFIX'] = os.getenv('DOWNLOAD_ACCEL_PREFIX', '/internal-downloads/')  # nginx internal location of DOWNLOAD_FOLDER
+if app.config['DOWNLOAD_OFFLOAD'] not in OFFLOAD_MODES:
+    raise ValueError(f"Unknown DOWNLOAD_OFFLOAD: {app.config['DOWNLOAD_OFFLOAD']}")
+# Optional speedups declared in pyproject.toml; the app works without them, slower and with fewer report formats
+if importlib.util.find_spec('pyarrow') is None:
+    logging.warning("pyarrow is not installed: CSV files are read with pandas and parquet reports are unavailable")
+if importlib.util.find_spec('zstandard') is None:
+    logging.warning("zstandard is not installed: csv.zst reports are unavailable")
+
+# Results keys that name a report file in DOWNLOAD_FOLDER
+REPORT_KEYS = ('valid_file', 'invalid_file', 'warning_file', 'duplicate_file', 'change_file')
+
+# Compressed CSV reports can be sent as plain CSV with a Content-Encoding
+# suffix -> (Content-Encoding, media type of the compressed file)
+COMPRESSED_REPORT_ENCODINGS = {'.csv.gz': ('gzip', 'application/gzip'), '.csv.zst': ('zstd', 'application/zstd')}
+
+# Rows per IN (...) lookup and per multi-row INSERT/UPDATE statement
+DB_CHUNK_SIZE = 500
+
+# MySQL client error codes that mean the connection is gone: can't connect, server gone away,
+# lost connection during query, lost connection at handshake. Deadlocks (1213) and lock wait
+# timeouts (1205) are OperationalErrors too, but the batch can be retried on the same connection.
+CONNECTION_LOST_CODES = {2003, 2006, 2013, 2055}
+
+def _is_connection_error(error):
+    """Whether a DB error left the connection unusable, so retrying row by row would fail every row"""
+    if isinstance(error, pymysql.err.InterfaceError):
+        return True
+    return (isinstance(error, pymysql.err.OperationalError)
+            and bool(error.args) and error.args[0] in CONNECTION_LOST_CODES)
 
 # Ensure directories exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(DOWNLOAD_FOLDER, exist_ok=True)
 
-def get_database_connection():
-    """Get database connection using environment variables"""
-    try:
-        connection = pymysql.connect(
-            host=os.getenv('DB_HOST'),
-            port=int(os.getenv('DB_PORT', 3306)),
-            user=os.getenv('DB_USER'),
-            password=os.getenv('DB_PASSWORD'),
-            database=os.getenv('DB_NAME'),
-            cursorclass=DictCursor,
-            charset='utf8mb4'
-        )
-        return connection
-    except Exception as e:
-        logging.error(f"Error connecting to database: {str(e)}")
-        return None
+# Background imports; progress lives in memory, so run gunicorn with a single worker process
+job_runner = JobRunner(max_workers=app.config['JOB_WORKERS'], max_pending=app.config['JOB_QUEUE_SIZE'])
+
+# Every import with its upload, checkpoint and results; unfinished ones are resumed on start
+job_store = JobStore(app.config['JOB_STORE_PATH'])
+job_store.prune(app.config['JOB_HISTORY_DAYS'] * 24 * 3600)
+atexit.register(job_store.close)
+
+# Index of the reports in DOWNLOAD_FOLDER; a background thread (started by main.py) deletes old ones
+retention = RetentionManager(
+    app.config['REPORT_INDEX_PATH'],
+    DOWNLOAD_FOLDER,
+    max_age=app.config['REPORT_MAX_AGE_DAYS'] * 24 * 3600,
+    max_bytes=app.config['REPORT_MAX_MB'] * 1024 * 1024,
+    max_job_bytes=app.config['REPORT_MAX_JOB_MB'] * 1024 * 1024,
+    interval=app.config['RETENTION_INTERVAL'],
+)
+atexit.register(retention.close)
+
+# Memoized DNI/phone/email validation results, optionally preloaded from disk
+configurar_caches(app.config['VALIDATION_CACHE_SIZE'], app.config['VALIDATION_CACHE_PATH'])
+
+# Shared connection pool; imports and /test-db borrow from it instead of reconnecting
+db_pool = ConnectionPool(
+    open_database_connection,
+    min_size=int(os.getenv('DB_POOL_MIN', 1)),
+    max_size=int(os.getenv('DB_POOL_MAX', 10)),
+    idle_timeout=int(os.getenv('DB_POOL_IDLE_TIMEOUT', 300)),
+    recycle=int(os.getenv('DB_POOL_RECYCLE', 3600)),
+    timeout=int(os.getenv('DB_POOL_TIMEOUT', 30)),
+)
+atexit.register(db_pool.close)
+# Every DB writer of every running import holds a connection for the whole import
+if app.config['DB_WORKERS'] * app.config['JOB_WORKERS'] > db_pool.max_size:
+    raise ValueError(f"DB_WORKERS x JOB_WORKERS ({app.config['DB_WORKERS']} x {app.config['JOB_WORKERS']}) "
+                     f"exceeds DB_POOL_MAX ({db_pool.max_size})")
+
+# DNI -> hash of the email/phone last written; lets incremental imports skip unchanged users
+import_snapshot = ImportSnapshot(app.config['SNAPSHOT_PATH'])
+atexit.register(import_snapshot.close)
 
 def test_database_connection():
     """Test database connection and return status"""
     try:
-        connection = get_database_connection()
-        if connection:
+        with db_pool.connection() as connection:
             with connection.cursor() as cursor:
                 cursor.execute("SELECT VERSION() as version")
                 result = cursor.fetchone()
-                connection.close()
                 return True, f"Connected to MariaDB {result['version']}"
-        else:
-            return False, "Unable to establish connection"
+    except PoolError as e:
+        logging.error(f"Error connecting to database: {str(e)}")
+        return False, "Unable to establish connection"
     except Exception as e:
         return False, f"Database error: {str(e)}"
 
-def insert_user_meta(cursor, user_id, dni, telefono):
-    """Insert or update user meta data in wp_usermeta table"""
-    inserted_meta = 0
-    updated_meta = 0
-    try:
-        logging.info(f"Inserting meta for user {user_id}, dni {dni}, telefono '{telefono}'")
-        # Define default meta keys and values
-        meta_keys = {
-            'nickname': dni,
-            'dni': dni,
-            'phone': telefono,
-            'old_user': '1',
-            'wp_capabilities': 'a:1:{s:10:"subscriber";b:1;}',
-            'wp_user_level': '0',
-            'show_admin_bar_front': 'false'
-        }
+def _chunks(items, size):
+    """Yield consecutive slices of at most size items"""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
 
-        # Check if user already has meta data by checking 'nickname' meta_key with DNI value
-        cursor.execute("""
-            SELECT COUNT(*) as count
-            FROM wp_usermeta
-            WHERE user_id = %s AND meta_key = 'nickname' AND meta_value = %s
-        """, (user_id, dni))
-        exists = cursor.fetchone()['count'] > 0
-        logging.info(f"User {user_id} exists meta: {exists}")
-
-        if exists:
-            # User has meta data, get existing meta data
-            cursor.execute("SELECT meta_key, meta_value FROM wp_usermeta WHERE user_id = %s", (user_id,))
-            existing_meta = {row['meta_key']: row['meta_value'] for row in cursor.fetchall()}
-            logging.info(f"Existing meta for user {user_id}: {existing_meta}")
-
-            # Update or insert meta keys
-            for key, value in meta_keys.items():
-                if key in existing_meta:
-                    # Update phone if changed
-                    if key == 'phone' and value:
-                        logging.info(f"Sync phone for user {user_id}: '{existing_meta.get(key)}' → '{value}'")
-                        cursor.execute("""
-                            UPDATE wp_usermeta
-                            SET meta_value = %s
-                            WHERE user_id = %s AND meta_key = %s
-                        """, (value, user_id, key))
-                        updated_meta += 1
+def _login_key(user_login):
+    """Key used to match logins the way MariaDB's case-insensitive collation does"""
+    return user_login.upper()
+
+def fetch_existing_users(cursor, logins):
+    """Load the wp_users rows for the given logins with chunked IN (...) queries"""
+    existing = {}
+    logins = list(dict.fromkeys(logins))
+    for chunk in _chunks(logins, DB_CHUNK_SIZE):
+        placeholders = ', '.join(['%s'] * len(chunk))
+        cursor.execute(f"""
+            SELECT ID, user_login, user_email, display_name, user_status
+            FROM wp_users
+            WHERE user_login IN ({placeholders})
+            ORDER BY ID
+        """, chunk)
+        for row in cursor.fetchall():
+            # Same row the old per-user SELECT ... fetchone() would have used
+            existing.setdefault(_login_key(row['user_login']), row)
+    return existing
+
+def plan_user_changes(valid_users, existing):
+    """
+    Split a batch of users into inserts, updates and skips in memory.
+
+    Users are handled in order and each one sees the state planned for the
+    previous ones, so repeated DNIs are counted exactly as the old per-row
+    SELECT/INSERT/UPDATE loop counted them.
+    Returns (planned, inserts, updates, counts, errors) where planned is a list of
+    (login_key, dni, telefono) for every user that will be written.
+    """
+    state = dict(existing)
+    planned = []
+    inserts = {}  # login_key -> row for the multi-row INSERT
+    updates = {}  # ID -> (user_email, display_name)
+    counts = {'inserted': 0, 'updated': 0, 'skipped': 0}
+    errors = []
+
+    for user in valid_users:
+        try:
+            dni = user.get('dni', '').strip()
+            email = user.get('email', '').strip()
+
+            # Use DNI as user_login (unique) and as display_name
+            user_login = dni
+            display_name = dni
+            key = _login_key(user_login)
+
+            current = state.get(key)
+            if current is None:
+                inserts[key] = {'user_login': user_login, 'user_email': email, 'display_name': display_name}
+                state[key] = {'ID': None, 'user_email': email, 'display_name': display_name, 'user_status': 0}
+                counts['inserted'] += 1
+            elif (current['user_email'] != email or
+                  current['display_name'] != display_name or
+                  current['user_status'] != 0):
+                if current['ID'] is None:
+                    # Changed again before being written: insert the latest values
+                    inserts[key].update(user_email=email, display_name=display_name)
                 else:
-                    # Insert missing meta keys
-                    logging.info(f"Inserting missing meta {key} = '{value}' for user {user_id}")
-                    cursor.execute("""
-                        INSERT INTO wp_usermeta (user_id, meta_key, meta_value)
-                        VALUES (%s, %s, %s)
-                    """, (user_id, key, value))
-                    inserted_meta += 1
-        else:
-            # No meta data exists, insert all meta keys
-            logging.info(f"Inserting all meta for new user {user_id}")
-            for key, value in meta_keys.items():
-                cursor.execute("""
-                    INSERT INTO wp_usermeta (user_id, meta_key, meta_value)
-                    VALUES (%s, %s, %s)
-                """, (user_id, key, value))
-                inserted_meta += len(meta_keys)
+                    updates[current['ID']] = (email, display_name)
+                state[key] = dict(current, user_email=email, display_name=display_name, user_status=0)
+                counts['updated'] += 1
+            else:
+                counts['skipped'] += 1
+
+            planned.append((key, dni, user.get('telefono', '')))
+        except Exception as e:
+            error_msg = f"Error insertando usuario {user.get('dni', 'desconocido')}: {str(e)}"
+            logging.error(error_msg)
+            errors.append(error_msg)
+
+    return planned, inserts, updates, counts, errors
+
+def apply_user_changes(cursor, inserts, updates):
+    """Write planned wp_users changes with multi-row statements and return the new IDs by login key"""
+    for chunk in _chunks(list(updates.items()), DB_CHUNK_SIZE):
+        rows = ' UNION ALL '.join(['SELECT %s AS ID, %s AS user_email, %s AS display_name'] * len(chunk))
+        params = [value for user_id, (email, display_name) in chunk for value in (user_id, email, display_name)]
+        cursor.execute(f"""
+            UPDATE wp_users u
+            JOIN ({rows}) v ON u.ID = v.ID
+            SET u.user_email = v.user_email, u.display_name = v.display_name, u.user_status = 0
+        """, params)
+
+    # Generate a default password (in production, this should be handled differently)
+    # For now, using a placeholder password that should be changed
+    default_password = '$P$BhKKDxDIIhoOs8dO8wK4fGNqYe3GKS0'
+
+    new_rows = list(inserts.values())
+    for chunk in _chunks(new_rows, DB_CHUNK_SIZE):
+        values = ', '.join(['(%s, %s, %s, %s, NOW(), 0, %s)'] * len(chunk))
+        params = []
+        for row in chunk:
+            # user_nicename same as user_login
+            params.extend((row['user_login'], default_password, row['user_login'], row['user_email'], row['display_name']))
+        cursor.execute(f"""
+            INSERT INTO wp_users (
+                user_login, user_pass, user_nicename, user_email,
+                user_registered, user_status, display_name
+            ) VALUES {values}
+        """, params)
+
+    # Recover the generated IDs in bulk
+    inserted = fetch_existing_users(cursor, [row['user_login'] for row in new_rows])
+    return {key: row['ID'] for key, row in inserted.items()}
+
+def default_user_meta(dni, telefono):
+    """Meta keys every imported user must have, with their default values"""
+    return {
+        'nickname': dni,
+        'dni': dni,
+        'phone': telefono,
+        'old_user': '1',
+        'wp_capabilities': 'a:1:{s:10:"subscriber";b:1;}',
+        'wp_user_level': '0',
+        'show_admin_bar_front': 'false'
+    }
+
+def fetch_user_meta(cursor, user_ids):
+    """Load the default meta keys of every user in the batch: {user_id: {meta_key: meta_value}}"""
+    existing = {}
+    user_ids = list(dict.fromkeys(user_ids))
+    meta_keys = list(default_user_meta('', ''))
+    key_placeholders = ', '.join(['%s'] * len(meta_keys))
+    for chunk in _chunks(user_ids, DB_CHUNK_SIZE):
+        placeholders = ', '.join(['%s'] * len(chunk))
+        cursor.execute(f"""
+            SELECT user_id, meta_key, meta_value
+            FROM wp_usermeta
+            WHERE user_id IN ({placeholders}) AND meta_key IN ({key_placeholders})
+            ORDER BY umeta_id
+        """, list(chunk) + meta_keys)
+        for row in cursor.fetchall():
+            existing.setdefault(row['user_id'], {}).setdefault(row['meta_key'], row['meta_value'])
+    return existing
+
+def plan_meta_changes(users, existing_meta):
+    """
+    Diff each user's meta against the default keys in memory.
+
+    users is a list of (user_id, dni, telefono) in file order. Missing keys are
+    inserted and 'phone' is updated when a non-empty value differs from the
+    stored one. Returns (inserts, phone_updates) where inserts is a list of
+    (user_id, meta_key, meta_value) and phone_updates maps user_id -> (old, new).
+    """
+    state = {user_id: dict(meta) for user_id, meta in existing_meta.items()}
+    inserts = []
+    phone_updates = {}
+    for user_id, dni, telefono in users:
+        current = state.setdefault(user_id, {})
+        for key, value in default_user_meta(dni, telefono).items():
+            if key not in current:
+                inserts.append((user_id, key, value))
+                current[key] = value
+            elif key == 'phone' and value and current[key] != value:
+                old_value = phone_updates[user_id][0] if user_id in phone_updates else current[key]
+                phone_updates[user_id] = (old_value, value)
+                current[key] = value
+    return inserts, phone_updates
+
+def sync_user_meta(cursor, users, index=None):
+    """
+    Bring wp_usermeta in line with the default keys for a whole batch of users
+    with a constant number of statements. Returns (inserted_meta, updated_meta).
+    index is an optional UserIndex transaction, as in write_users_batch.
+    """
+    if not users:
+        return 0, 0
+
+    user_ids = [user_id for user_id, _, _ in users]
+    existing_meta = index.meta(user_ids) if index is not None else fetch_user_meta(cursor, user_ids)
+    inserts, phone_updates = plan_meta_changes(users, existing_meta)
+    # A phone changed and changed back within the batch needs no write
+    phone_updates = {user_id: change for user_id, change in phone_updates.items() if change[0] != change[1]}
+    if index is not None:
+        for user_id, meta_key, meta_value in inserts:
+            index.record_meta(user_id, meta_key, meta_value)
+        for user_id, (_, telefono) in phone_updates.items():
+            index.record_meta(user_id, 'phone', telefono)
+
+    for chunk in _chunks(inserts, DB_CHUNK_SIZE):
+        values = ', '.join(['(%s, %s, %s)'] * len(chunk))
+        cursor.execute(f"""
+            INSERT INTO wp_usermeta (user_id, meta_key, meta_value)
+            VALUES {values}
+        """, [value for row in chunk for value in row])
+
+    for chunk in _chunks(list(phone_updates.items()), DB_CHUNK_SIZE):
+        rows = ' UNION ALL '.join(['SELECT %s AS user_id, %s AS meta_value'] * len(chunk))
+        params = [value for user_id, (_, telefono) in chunk for value in (user_id, telefono)]
+        cursor.execute(f"""
+            UPDATE wp_usermeta m
+            JOIN ({rows}) v ON m.user_id = v.user_id
+            SET m.meta_value = v.meta_value
+            WHERE m.meta_key = 'phone'
+        """, params)
+
+    logging.info(f"Meta sync: {len(inserts)} inserted, {len(phone_updates)} phone values updated")
+    return len(inserts), len(phone_updates)
+
+# Optional in-memory copy of wp_users and the default meta; loaded on the first import that needs it
+user_index = UserIndex(db_pool.connection, list(default_user_meta('', '')),
+                       max_age=app.config['USER_INDEX_MAX_AGE']) if app.config['USER_INDEX'] else None
+
+def write_users_batch(cursor, valid_users, index=None):
+    """
+    Upsert a batch of users and their meta with the given cursor.
+    Does not commit; database errors propagate to the caller.
+    With index (a UserIndex transaction) existing users and meta are looked
+    up in memory instead of the database, and the writes are recorded in it.
+    Returns (processed, inserted, updated, skipped, inserted_meta, updated_meta, errors)
+    where errors lists the users that could not be written.
+    """
+    errors = []
+
+    with metrics.timed('db_users'):
+        logins = [str(user.get('dni', '')).strip() for user in valid_users]
+        existing = index.users(logins) if index is not None else fetch_existing_users(cursor, logins)
+
+        planned, inserts, updates, counts, plan_errors = plan_user_changes(valid_users, existing)
+        errors.extend(plan_errors)
+        logging.info(f"Planned {len(inserts)} inserts, {len(updates)} updates, {counts['skipped']} unchanged users")
+
+        new_ids = apply_user_changes(cursor, inserts, updates)
+        if index is not None:
+            for key, row in inserts.items():
+                if key in new_ids:
+                    index.record_user(new_ids[key], row['user_login'], row['user_email'], row['display_name'])
+            for key, row in existing.items():
+                if row['ID'] in updates:
+                    email, display_name = updates[row['ID']]
+                    index.record_user(row['ID'], key, email, display_name)
+
+    # Handle user meta data for all processed users in one pass
+    with metrics.timed('db_meta'):
+        meta_users = []
+        for key, dni, telefono in planned:
+            try:
+                user_id = existing[key]['ID'] if key in existing else new_ids[key]
+                meta_users.append((user_id, dni, telefono))
+            except Exception as e:
+                error_msg = f"Error insertando usuario {dni}: {str(e)}"
+                logging.error(error_msg)
+                errors.append(error_msg)
+
+        inserted_meta, updated_meta = sync_user_meta(cursor, meta_users, index)
+
+    return (len(meta_users), counts['inserted'], counts['updated'], counts['skipped'],
+            inserted_meta, updated_meta, errors)
+
+# Columns of the dry-run change report
+CHANGE_COLUMNS = ['dni', 'accion', 'cambios', 'email_actual', 'email_nuevo', 'telefono_actual', 'telefono_nuevo']
+
+def diff_users_batch(cursor, valid_users, index=None):
+    """
+    Plan a batch exactly like write_users_batch, reading the same rows, but
+    write nothing. Returns (processed, inserted, updated, skipped,
+    inserted_meta, updated_meta, errors, changes) where changes lists, as
+    dicts with CHANGE_COLUMNS, every user that would be inserted or changed.
+    """
+    with metrics.timed('db_users'):
+        logins = [str(user.get('dni', '')).strip() for user in valid_users]
+        existing = index.users(logins) if index is not None else fetch_existing_users(cursor, logins)
+        planned, inserts, updates, counts, errors = plan_user_changes(valid_users, existing)
+
+    with metrics.timed('db_meta'):
+        user_ids = [existing[key]['ID'] for key, _, _ in planned if key in existing]
+        existing_meta = index.meta(user_ids) if index is not None else fetch_user_meta(cursor, user_ids)
+        # New users have no ID yet; their login key stands in for it
+        meta_users = [(existing[key]['ID'] if key in existing else key, dni, telefono) for key, dni, telefono in planned]
+        meta_inserts, phone_updates = plan_meta_changes(meta_users, existing_meta)
+        phone_updates = {user_id: change for user_id, change in phone_updates.items() if change[0] != change[1]}
+
+    missing_meta = Counter(user_id for user_id, _, _ in meta_inserts)
+    changes = []
+    # The last row of a repeated DNI carries its final values
+    for key, (dni, telefono) in {key: (dni, telefono) for key, dni, telefono in planned}.items():
+        current = existing.get(key)
+        if current is None:
+            changes.append({'dni': dni, 'accion': 'alta', 'cambios': '', 'email_actual': '',
+                            'email_nuevo': inserts[key]['user_email'], 'telefono_actual': '', 'telefono_nuevo': telefono})
+            continue
+        user_id = current['ID']
+        email, display_name = updates.get(user_id, (current['user_email'], current['display_name']))
+        old_phone, new_phone = phone_updates.get(user_id, (None, None))
+        changed = [label for label, differs in (
+            ('email', email != current['user_email']),
+            ('nombre', display_name != current['display_name']),
+            ('estado', user_id in updates and current['user_status'] != 0),
+            ('teléfono', user_id in phone_updates),
+            ('metadatos', missing_meta[user_id] > 0),
+        ) if differs]
+        if changed:
+            phone = existing_meta.get(user_id, {}).get('phone') or ''
+            changes.append({'dni': dni, 'accion': 'modificación', 'cambios': ', '.join(changed),
+                            'email_actual': current['user_email'], 'email_nuevo': email,
+                            'telefono_actual': old_phone if old_phone is not None else phone,
+                            'telefono_nuevo': new_phone if new_phone is not None else phone})
+
+    return (len(meta_users), counts['inserted'], counts['updated'], counts['skipped'],
+            len(meta_inserts), len(phone_updates), errors, changes)
+
+def preview_users_batch(connection, users):
+    """Dry-run counterpart of commit_users_batch: (counts, errors, changes) as in diff_users_batch"""
+    if user_index is not None:
+        with metrics.timed('user_index'):
+            user_index.refresh(connection)
+    with connection.cursor() as cursor:
+        *counts, errors, changes = diff_users_batch(cursor, users, user_index)
+    # Ends the read transaction, so the next batch sees what the site wrote meanwhile
+    connection.rollback()
+    return counts, errors, changes
+
+def _write_and_commit(connection, users):
+    index = user_index.transaction() if user_index is not None else None
+    with connection.cursor() as cursor:
+        *counts, errors = write_users_batch(cursor, users, index)
+    with metrics.timed('db_commit'):
+        connection.commit()
+    if index is not None:
+        index.apply()
+    return counts, errors
+
+def commit_users_batch(connection, users):
+    """
+    Write users in one transaction and commit it. If the batch fails, roll
+    it back and write the users one by one, so only the rows that fail
+    again are lost and reported; deadlocks and lock wait timeouts included.
+    Errors that lost the connection are raised instead.
+    Returns (counts, errors, written): counts as in write_users_batch, the
+    error messages and the users that were committed.
+    """
+    if user_index is not None:
+        # Picks up users created since the last batch, by the site or other imports; on this
+        # writer's connection, since borrowing another could wait for the whole pool
+        with metrics.timed('user_index'):
+            user_index.refresh(connection)
+    try:
+        counts, errors = _write_and_commit(connection, users)
+        return counts, errors, users
     except Exception as e:
-        logging.error(f"Error in insert_user_meta for user {user_id}: {str(e)}")
-    return inserted_meta, updated_meta
+        if _is_connection_error(e):
+            raise
+        connection.rollback()
+        logging.warning(f"Batch of {len(users)} users failed, retrying one by one: {str(e)}")
+        metrics.DB_BATCH_RETRIES.inc()
+
+    counts, errors, written = [0] * 6, [], []
+    for user in users:
+        try:
+            user_counts, user_errors = _write_and_commit(connection, [user])
+        except Exception as e:
+            if _is_connection_error(e):
+                raise
+            connection.rollback()
+            error_msg = f"Error insertando usuario {user.get('dni', '')}: {str(e)}"
+            logging.error(error_msg)
+            errors.append(error_msg)
+            continue
+        counts = [total + count for total, count in zip(counts, user_counts)]
+        errors.extend(user_errors)
+        written.append(user)
+    return counts, errors, written
 
-def insert_valid_users_to_db(valid_users):
-    """Insert valid users into the wp_users table and handle wp_usermeta"""
+def insert_valid_users_to_db(valid_users, progress_callback=None, batch_size=None):
+    """
+    Insert valid users into the wp_users table and handle wp_usermeta,
+    committing every batch_size users (DB_BATCH_SIZE by default)
+    """
     if not valid_users:
         return 0, 0, 0, 0, 0, 0, []
 
-    connection = get_database_connection()
-    if not connection:
+    try:
+        connection = db_pool.acquire()
+    except PoolError as e:
+        logging.error(f"Error connecting to database: {str(e)}")
         return 0, 0, 0, 0, 0, 0, ["Error: No se pudo conectar a la base de datos"]
 
-    processed_count = 0
-    inserted_count = 0
-    updated_count = 0
-    skipped_count = 0
-    inserted_meta_total = 0
-    updated_meta_total = 0
+    counts = [0, 0, 0, 0, 0, 0]
     errors = []
 
+    if progress_callback:
+        progress_callback('db_insert', 0, len(valid_users))
+
     try:
-        with connection.cursor() as cursor:
-            for user in valid_users:
-                try:
-                    dni = user.get('dni', '').strip()
-                    email = user.get('email', '').strip()
-
-                    # Generate a default password (in production, this should be handled differently)
-                    # For now, using a placeholder password that should be changed
-                    default_password = '$P$BhKKDxDIIhoOs8dO8wK4fGNqYe3GKS0'
-
-                    # Use DNI as user_login (unique)
-                    user_login = dni
-
-                    # Generate display_name (could be improved with more data)
-                    display_name = dni  # Or use name if available
-
-                    # Check if user already exists by login (DNI should be unique)
-                    cursor.execute("""
-                        SELECT ID, user_email, display_name, user_status
-                        FROM wp_users
-                        WHERE user_login = %s
-                    """, (user_login,))
-                    existing_user = cursor.fetchone()
-
-                    if existing_user:
-                        user_id = existing_user['ID']
-                        # Check if data has changed
-                        needs_update = (
-                            existing_user['user_email'] != email or
-                            existing_user['display_name'] != display_name or
-                            existing_user['user_status'] != 0
-                        )
-
-                        if needs_update:
-                            # Update existing user only if data changed
-                            sql = """
-                                UPDATE wp_users
-                                SET user_email = %s, display_name = %s, user_status = 0
-                                WHERE ID = %s
-                            """
-                            result = cursor.execute(sql, (email, display_name, existing_user['ID']))
-                            logging.info(f"Updated existing user {user_login} (data changed) - Rows affected: {result}")
-                            updated_count += 1
-                        else:
-                            logging.info(f"Skipped update for user {user_login} (data unchanged)")
-                            skipped_count += 1
-                    else:
-                        # Insert new user
-                        sql = """
-                            INSERT INTO wp_users (
-                                user_login, user_pass, user_nicename, user_email,
-                                user_registered, user_status, display_name
-                            ) VALUES (%s, %s, %s, %s, NOW(), 0, %s)
-                        """
-                        result = cursor.execute(sql, (
-                            user_login,
-                            default_password,
-                            user_login,  # user_nicename same as user_login
-                            email,
-                            display_name
-                        ))
-                        user_id = cursor.lastrowid
-                        logging.info(f"Inserted new user {user_login} - Rows affected: {result}")
-                        inserted_count += 1
-
-                    # Handle user meta data for all processed users
-                    telefono = user.get('telefono', '')
-                    inserted_meta, updated_meta = insert_user_meta(cursor, user_id, dni, telefono)
-                    inserted_meta_total += inserted_meta
-                    updated_meta_total += updated_meta
-
-                    processed_count += 1
-
-                except Exception as e:
-                    error_msg = f"Error insertando usuario {user.get('dni', 'desconocido')}: {str(e)}"
-                    logging.error(error_msg)
-                    errors.append(error_msg)
-
-        logging.info(f"Committing transaction with {processed_count} processed users")
-        connection.commit()
-        logging.info("Transaction committed successfully")
+        for batch in _chunks(valid_users, batch_size or app.config['DB_BATCH_SIZE']):
+            batch_counts, batch_errors, _ = commit_users_batch(connection, batch)
+            counts = [total + count for total, count in zip(counts, batch_counts)]
+            errors.extend(batch_errors)
+
+            if progress_callback:
+                progress_callback('db_insert', counts[0], len(valid_users))
+        logging.info(f"Committed {counts[0]} processed users")
 
     except Exception as e:
+        # Batches committed before the error stay in the database
         logging.error(f"Rolling back transaction due to error: {str(e)}")
         connection.rollback()
         errors.append(f"Error en la transacción: {str(e)}")
     finally:
-        connection.close()
-        logging.info("Database connection closed")
+        db_pool.release(connection)
+        logging.info("Database connection returned to pool")
+
+    return (*counts, errors)
+
+class DatabaseWriter:
+    """
+    Consumer for the import pipeline's DB stage. Each worker thread keeps one
+    pooled connection for the whole import and commits the users it gets in
+    transactions of batch_size users (see commit_users_batch); totals and
+    progress are shared between the workers.
+
+    Batches are (chunk index, users). Once every batch of a chunk and of the
+    chunks before it is committed, on_checkpoint gets the totals up to that
+    chunk, so an interrupted import can be resumed after it (see restore).
+
+    Committed users are recorded in the import snapshot. In incremental mode
+    users whose email and phone match the snapshot are not sent to the DB.
+
+    With on_changes the writer only previews: every batch goes through
+    preview_users_batch instead of being written, and on_changes gets the
+    list of changes it would make (called from several threads).
+    """
+
+    def __init__(self, progress_callback=None, snapshot=None, incremental=False, timings=None,
+                 on_checkpoint=None, batch_size=None, on_changes=None):
+        # processed, inserted, updated, skipped, inserted_meta, updated_meta
+        self.totals = [0, 0, 0, 0, 0, 0]
+        self.unchanged = 0
+        self.errors = []
+        self.queued = 0
+        self._progress_callback = progress_callback
+        self._snapshot = snapshot
+        self._incremental = incremental and snapshot is not None
+        self._timings = timings
+        self._on_checkpoint = on_checkpoint
+        self._batch_size = batch_size or app.config['DB_BATCH_SIZE']
+        self._on_changes = on_changes
+        # Chunks not yet folded into the checkpoint: index -> batches pending and their results
+        self._chunks = {}
+        self._checkpoint = {'chunk': -1, 'totals': list(self.totals), 'unchanged': 0, 'errors': []}
+        self._lock = threading.Lock()
+
+    def restore(self, checkpoint):
+        """Continue from a checkpoint of an earlier run of the same import"""
+        with self._lock:
+            self._checkpoint = {key: checkpoint[key] for key in ('chunk', 'totals', 'unchanged', 'errors')}
+            self.totals = list(checkpoint['totals'])
+            self.unchanged = checkpoint['unchanged']
+            self.errors = list(checkpoint['errors'])
+            self.queued = self.totals[0] + self.unchanged
+
+    def add_chunk(self, index, batches, rows):
+        """Announce that chunk index will arrive as the given number of batches with rows users in total"""
+        with self._lock:
+            self.queued += rows
+            self._chunks[index] = {'pending': batches, 'totals': [0] * len(self.totals), 'unchanged': 0, 'errors': []}
+            self._advance_checkpoint()
+
+    def _advance_checkpoint(self):
+        # Called with the lock held
+        advanced = False
+        while self._chunks.get(self._checkpoint['chunk'] + 1, {}).get('pending') == 0:
+            chunk = self._chunks.pop(self._checkpoint['chunk'] + 1)
+            self._checkpoint = {
+                'chunk': self._checkpoint['chunk'] + 1,
+                'totals': [total + count for total, count in zip(self._checkpoint['totals'], chunk['totals'])],
+                'unchanged': self._checkpoint['unchanged'] + chunk['unchanged'],
+                'errors': self._checkpoint['errors'] + chunk['errors'],
+            }
+            advanced = True
+        if advanced and self._on_checkpoint:
+            self._on_checkpoint(self._checkpoint)
+
+    def _add_results(self, index, counts, errors, unchanged, chunk_done=False):
+        with self._lock:
+            self.totals = [total + count for total, count in zip(self.totals, counts)]
+            self.unchanged += unchanged
+            self.errors.extend(errors)
+            done, target = self.totals[0] + self.unchanged, self.queued
+
+            chunk = self._chunks[index]
+            chunk['totals'] = [total + count for total, count in zip(chunk['totals'], counts)]
+            chunk['unchanged'] += unchanged
+            chunk['errors'].extend(errors)
+            if chunk_done:
+                chunk['pending'] -= 1
+                self._advance_checkpoint()
+        if self._progress_callback:
+            self._progress_callback('db_insert', done, target)
+
+    def consume(self, batches):
+        with metrics.bind(self._timings):
+            self._consume(batches)
+
+    def _consume(self, batches):
+        try:
+            connection = db_pool.acquire()
+        except PoolError as e:
+            # Same behaviour as insert_valid_users_to_db: report it and keep the CSV results
+            logging.error(f"Error connecting to database: {str(e)}")
+            with self._lock:
+                if "Error: No se pudo conectar a la base de datos" not in self.errors:
+                    self.errors.append("Error: No se pudo conectar a la base de datos")
+            for _ in batches:
+                pass
+            return
+
+        try:
+            for index, users in batches:
+                unchanged = 0
+                if self._incremental:
+                    changed = self._snapshot.changed(users)
+                    unchanged = len(users) - len(changed)
+                    users = changed
+
+                # One transaction per DB_BATCH_SIZE users, so rows are never locked for a whole chunk
+                for batch in _chunks(users, self._batch_size):
+                    if self._on_changes is not None:
+                        counts, errors, changes = preview_users_batch(connection, batch)
+                        self._on_changes(changes)
+                    else:
+                        counts, errors, written = commit_users_batch(connection, batch)
+                        if self._snapshot is not None:
+                            self._snapshot.record(written)
+                    self._add_results(index, counts, errors, 0)
+                self._add_results(index, [0] * len(self.totals), [], unchanged, chunk_done=True)
+        finally:
+            # Rolls back whatever a failed batch left uncommitted
+            db_pool.release(connection)
+
+def _partition_by_login(df_validos, parts):
+    """Split valid rows so that a given DNI always goes to the same DB writer"""
+    if parts == 1:
+        yield 0, df_validos.to_dict('records')
+        return
+    keys = dni_keys(df_validos)
+    buckets = pd.util.hash_pandas_object(keys, index=False).to_numpy() % parts
+    for worker in range(parts):
+        part = df_validos[buckets == worker]
+        if len(part) > 0:
+            yield worker, part.to_dict('records')
+
+def _read_chunks(source, chunk_size):
+    """Read the CSV in chunks of chunk_size rows, as text, with lowercase column names"""
+    with metrics.timed('parse'):
+        reader = read_csv_chunks(source, chunk_size, app.config['CSV_ENGINE'])
+    while True:
+        with metrics.timed('parse'):
+            chunk = next(reader, None)
+        if chunk is None:
+            return
+        # Normalize column names to lowercase
+        chunk.columns = chunk.columns.str.lower()
+        yield chunk
+
+def _validation_context():
+    """
+    Start method for the validation processes. Forking a process that already
+    runs pipeline threads is not safe; a fork server started once, with only
+    validators (and pandas) imported, is, and its children start fast. spawn
+    where there is none (Windows).
+    Both still import the launching script as __mp_main__ in every child, so
+    main.py, cli.py and the benchmarks keep their side effects under __main__.
+    """
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('spawn')
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload(['validators'])
+    return context
+
+def _validate_chunks(chunks, validation_workers):
+    """
+    Yield (chunk, (df_validos, df_no_validos, df_warnings)) for every chunk, in
+    file order. With more than one worker the chunks are validated in a process
+    pool, keeping at most two chunks per worker in flight.
+    """
+    if validation_workers <= 1:
+        for chunk in chunks:
+            with metrics.timed('validation'):
+                frames = validar_dataframe(chunk)
+            yield chunk, frames
+        return
+
+    executor = ProcessPoolExecutor(
+        max_workers=validation_workers,
+        mp_context=_validation_context(),
+        initializer=configurar_caches,
+        initargs=(app.config['VALIDATION_CACHE_SIZE'], app.config['VALIDATION_CACHE_PATH']),
+    )
+    pending = deque()
+    try:
+        for chunk in chunks:
+            pending.append((chunk, executor.submit(validar_dataframe, chunk)))
+            if len(pending) >= validation_workers * 2:
+                chunk, future = pending.popleft()
+                with metrics.timed('validation'):
+                    frames = future.result()
+                yield chunk, frames
+        while pending:
+            chunk, future = pending.popleft()
+            with metrics.timed('validation'):
+                frames = future.result()
+            yield chunk, frames
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
 
-    return processed_count, inserted_count, updated_count, skipped_count, inserted_meta_total, updated_meta_total, errors
+def trace_rows(chunk, df_validos, df_no_validos, df_warnings, every):
+    """Log the raw and cleaned phone/email of one of every `every` rows of the chunk"""
+    sampled = chunk.index[chunk.index % every == 0]
+    if len(sampled) == 0:
+        return
+    cleaned = pd.concat([df_validos[df_validos.index.isin(sampled)], df_no_validos[df_no_validos.index.isin(sampled)]])
+    for row in sampled:
+        raw = chunk.loc[row]
+        clean = cleaned.loc[row]
+        if row in df_no_validos.index:
+            status = f"invalid ({df_no_validos.at[row, 'motivo_invalido']})"
+        elif row in df_warnings.index:
+            status = f"warning ({df_warnings.at[row, 'motivo_warning']})"
+        else:
+            status = "valid"
+        trace_logger.info(
+            f"Row {row + 1}: dni={raw.get('dni')!r} telefono={raw.get('telefono')!r} -> {clean.get('telefono')!r} "
+            f"email={raw.get('email')!r} -> {clean.get('email')!r}: {status}"
+        )
 
 def allowed_file(filename):
     """Check if file extension is allowed"""
@@ -259,7 +820,9 @@ def puede_escribir_archivo(ruta):
 @app.route('/')
 def index():
     """Main page with file upload form"""
-    return render_template('index.html')
+    return render_template('index.html', report_formats=available_formats(),
+                           default_report_format=app.config['REPORT_FORMAT'],
+                           dedup_rules=DEDUP_RULES, default_dedup_rule=app.config['DEDUP_RULE'])
 
 @app.route('/test-db')
 def test_db():
@@ -271,6 +834,33 @@ def test_db():
         flash(f'❌ Error de conexión: {message}', 'error')
     return redirect(url_for('index'))
 
+@app.route('/db-pool-stats')
+def db_pool_stats():
+    """Connection pool usage: connections in use and idle, wait times"""
+    return jsonify(db_pool.stats())
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Import, phase and database counters in Prometheus text format"""
+    return app.response_class(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/user-index-stats')
+def user_index_stats():
+    """Size and age of the in-memory user index (USER_INDEX=1)"""
+    if user_index is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(user_index.stats(), enabled=True))
+
+@app.route('/report-storage-stats')
+def report_storage_stats():
+    """Files and bytes of the reports in DOWNLOAD_FOLDER, from the retention index"""
+    return jsonify(retention.stats())
+
+@app.route('/validation-cache-stats')
+def validation_cache_stats():
+    """Size, hits and misses of the DNI/phone/email validation caches"""
+    return jsonify(estadisticas_caches())
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     """Handle file upload and processing"""
@@ -289,16 +879,57 @@ def upload_file():
             file_id = str(uuid.uuid4())
             filename = secure_filename(file.filename)
             upload_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{file_id}_{filename}")
-            file.save(upload_path)
-            
-            # Process the file
-            results = process_csv_file(upload_path, file_id)
-            
-            # Clean up uploaded file
-            os.remove(upload_path)
-            
-            return render_template('results.html', results=results, file_id=file_id)
+            content_hash = save_upload(file, upload_path)
             
+            # Queue the file; the worker removes the upload when it finishes
+            incremental = request.form.get('incremental') is not None
+            dry_run = request.form.get('dry_run') is not None
+            report_format = request.form.get('report_format') or app.config['REPORT_FORMAT']
+            if report_format not in available_formats():
+                os.remove(upload_path)
+                flash('Formato de informe no disponible', 'error')
+                return redirect(url_for('index'))
+            dedup_rule = request.form.get('dedup_rule') or app.config['DEDUP_RULE']
+            if dedup_rule not in DEDUP_RULES:
+                os.remove(upload_path)
+                flash('Regla de duplicados no válida', 'error')
+                return redirect(url_for('index'))
+            options = {
+                'incremental': incremental,
+                'dry_run': dry_run,
+                'report_format': report_format,
+                'dedup_rule': dedup_rule,
+                'chunk_size': app.config['CSV_CHUNK_SIZE'],
+                'timestamp': datetime.now().strftime("%Y%m%d_%H%M%S"),
+            }
+
+            # The same file was already imported: reuse its results instead of validating it again
+            cached = None if dry_run else find_cached_import(content_hash, report_format, dedup_rule)
+            if cached is not None:
+                os.remove(upload_path)
+                if cached['status'] != 'done':
+                    # Still being imported: a second import would write the same rows at the same time
+                    flash('Este archivo ya se está importando; se muestra el progreso de esa importación.', 'info')
+                    return redirect(url_for('show_results', file_id=cached['job_id']))
+                if request.form.get('resync') is None:
+                    imported_at = datetime.fromtimestamp(cached['updated_at']).strftime('%d/%m/%Y %H:%M')
+                    flash(f'Este archivo ya se importó el {imported_at}; se muestran los resultados de entonces. '
+                          'Para escribirlo otra vez en la base de datos, marca «Volver a escribir en la base de datos».',
+                          'info')
+                    return redirect(url_for('show_results', file_id=cached['job_id']))
+                # Only the database part is repeated, from the earlier import's valid report
+                upload_path, content_hash = '', None
+                options['resync_from'] = cached['job_id']
+
+            job_store.create(file_id, upload_path, options, content_hash=content_hash)
+            if not job_runner.submit(file_id, run_import_job, file_id):
+                job_store.delete(file_id)
+                _remove_upload(upload_path)
+                flash('Hay demasiadas importaciones en curso. Inténtalo de nuevo en unos minutos.', 'error')
+                return redirect(url_for('index'))
+
+            return render_template('processing.html', file_id=file_id)
+
         except Exception as e:
             logging.error(f"Error processing file: {str(e)}")
             flash(f'Error al procesar el archivo: {str(e)}', 'error')
@@ -307,157 +938,546 @@ def upload_file():
         flash('Tipo de archivo no permitido. Solo se aceptan archivos CSV.', 'error')
         return redirect(url_for('index'))
 
-def process_csv_file(file_path, file_id):
-    """Process CSV file and validate data"""
+@app.route('/upload-stream', methods=['POST'])
+def upload_stream():
+    """
+    Upload and import at the same time: the body is parsed while it arrives
+    and fed to the import job, so validation and database writes overlap the
+    upload and the file is never written to disk. Options come in the query
+    string (incremental, dry_run, report_format, dedup_rule) because the browser sends the form
+    fields after the file. The body is multipart/form-data or the raw CSV.
+    Only accepted while a job worker is idle, since the upload waits for the import.
+    """
+    parts = iter_request_file(request)
+    try:
+        filename = next(parts, None)
+    except Exception as e:
+        logging.error(f"Error reading upload: {str(e)}")
+        flash('Error al recibir el archivo', 'error')
+        return redirect(url_for('index'))
+    if not filename:
+        flash('No se seleccionó ningún archivo', 'error')
+        return redirect(url_for('index'))
+    if not allowed_file(filename):
+        flash('Tipo de archivo no permitido. Solo se aceptan archivos CSV.', 'error')
+        return redirect(url_for('index'))
+
+    report_format = request.args.get('report_format') or app.config['REPORT_FORMAT']
+    if report_format not in available_formats():
+        flash('Formato de informe no disponible', 'error')
+        return redirect(url_for('index'))
+    dedup_rule = request.args.get('dedup_rule') or app.config['DEDUP_RULE']
+    if dedup_rule not in DEDUP_RULES:
+        flash('Regla de duplicados no válida', 'error')
+        return redirect(url_for('index'))
+
+    file_id = str(uuid.uuid4())
+    job_store.create(file_id, '', {
+        'incremental': request.args.get('incremental') not in (None, '', '0'),
+        'dry_run': request.args.get('dry_run') not in (None, '', '0'),
+        'report_format': report_format,
+        'dedup_rule': dedup_rule,
+        'chunk_size': app.config['CSV_CHUNK_SIZE'],
+        'timestamp': datetime.now().strftime("%Y%m%d_%H%M%S"),
+        'streamed': True,
+    })
+    upload = UploadStream(size=request.content_length)
+    # A queued job would not read the stream, and this request would hang until a worker frees up
+    if not job_runner.submit_now(file_id, run_import_job, file_id, upload=upload):
+        job_store.delete(file_id)
+        flash('Todas las importaciones están ocupadas. Inténtalo de nuevo en unos minutos '
+              'o sube el archivo sin la opción "Procesar mientras se sube".', 'error')
+        return redirect(url_for('index'))
+
+    complete = False
+    digest = hashlib.sha256()
+    try:
+        for data in parts:
+            digest.update(data)
+            upload.feed(data)
+        complete = True
+        # Known only now, too late to skip the import; a later upload of the same file can reuse it
+        job_store.set_content_hash(file_id, digest.hexdigest())
+    except UploadAborted:
+        # The import failed and stopped reading; processing.html shows its error
+        pass
+    except Exception as e:
+        logging.error(f"Upload {file_id} interrupted: {str(e)}")
+    finally:
+        # Always end the stream, or the import would wait for more data forever
+        if complete:
+            upload.finish()
+        else:
+            upload.abort("La subida del archivo se interrumpió")
+    return render_template('processing.html', file_id=file_id)
+
+def run_import_job(file_id, progress_callback=None, upload=None):
+    """
+    Background job: process an upload recorded in the job store, from its
+    last checkpoint if it was interrupted, and remove the upload once the
+    import has finished or failed.
+
+    upload is the UploadStream of a file that is still arriving (see
+    /upload-stream). There is no file to resume those from, so they are not
+    checkpointed; neither are dry runs, which start over instead.
+
+    Jobs with a resync_from option only write the valid report of that
+    earlier import of the same file to the database again (see resync_import).
+    """
+    job = job_store.get(file_id)
+    options = job['options']
+    job_store.start(file_id)
+    # Imports queued before dedup rules existed use the configured one
+    deduplicator = Deduplicator(options.get('dedup_rule', app.config['DEDUP_RULE']))
+    dry_run = options.get('dry_run', False)
+    try:
+        if options.get('resync_from'):
+            results = resync_import(options['resync_from'], progress_callback=progress_callback,
+                                    incremental=options['incremental'], chunk_size=options['chunk_size'])
+        elif upload is not None:
+            results = process_csv_file(upload, file_id, progress_callback=progress_callback,
+                                       incremental=options['incremental'], report_format=options['report_format'],
+                                       chunk_size=options['chunk_size'], timestamp=options['timestamp'],
+                                       deduplicator=deduplicator, dry_run=dry_run)
+        else:
+            results = process_csv_file(job['upload_path'], file_id, progress_callback=progress_callback,
+                                       incremental=options['incremental'], report_format=options['report_format'],
+                                       chunk_size=options['chunk_size'], timestamp=options['timestamp'],
+                                       deduplicator=deduplicator, dry_run=dry_run,
+                                       resume=job['checkpoint'],
+                                       on_checkpoint=lambda state: job_store.checkpoint(file_id, state))
+    except Exception as e:
+        job_store.fail(file_id, str(e))
+        if upload is not None:
+            # Unblocks the request thread if it is still feeding the upload
+            upload.close()
+        _remove_upload(job['upload_path'])
+        _register_reports(file_id, options)
+        raise
+    # If the process dies before this point the job stays 'running' and keeps its upload
+    job_store.finish(file_id, results)
+    _remove_upload(job['upload_path'])
+    _register_reports(file_id, options)
+    return results
+
+def _register_reports(file_id, options):
+    # Also after a failure, so the reports it left are cleaned up; a resync writes none of its own
+    if not options.get('resync_from'):
+        retention.register(file_id, report_names(file_id, options['timestamp'], options['report_format']))
+        retention.wake()
+
+def _remove_upload(upload_path):
+    if upload_path and os.path.exists(upload_path):
+        os.remove(upload_path)
+
+def find_cached_import(content_hash, report_format, dedup_rule):
+    """
+    Latest import of a file with the same content, report format and dedup
+    rule that is still queued or running here, or finished with its reports
+    still there; None otherwise. Dry runs and imports with database errors are
+    not reused: their database part has to run again.
+    """
+    folder = app.config['DOWNLOAD_FOLDER']
+    for job in job_store.find_by_hash(content_hash):
+        options, results = job['options'], job['results'] or {}
+        if (options.get('dry_run') or options.get('resync_from') or results.get('db_insert_errors')
+                or options['report_format'] != report_format
+                or options.get('dedup_rule', app.config['DEDUP_RULE']) != dedup_rule):
+            continue
+        if job['status'] != 'done':
+            # A double click or a retry after a timeout: follow the import already under way.
+            # One left queued by a restart with a full queue is not running, so it does not count
+            running = job_runner.get(job['job_id'])
+            if running is not None and running['phase'] in ('queued', 'running'):
+                return job
+            continue
+        if all(os.path.exists(os.path.join(folder, results[key])) for key in REPORT_KEYS if results.get(key)):
+            return job
+    return None
+
+def resync_import(source_id, progress_callback=None, incremental=False, chunk_size=None, db_workers=None):
+    """
+    Write the valid rows of an earlier import to the database again, read
+    back from its valid report, so an upload of the same file does not have
+    to be parsed, validated and deduplicated again. Returns the earlier
+    import's results (same report files) with the new database totals.
+    """
+    source = job_store.get(source_id)
+    valid_file = source['results'].get('valid_file') if source and source['status'] == 'done' else None
+    if source is None or source['status'] != 'done' or (
+            valid_file and not os.path.exists(os.path.join(app.config['DOWNLOAD_FOLDER'], valid_file))):
+        raise ValueError("Los informes de la importación anterior ya no existen. Vuelve a subir el archivo.")
+    cached = source['results']
+    chunk_size = chunk_size or app.config['CSV_CHUNK_SIZE']
+    timings = metrics.ImportTimings()
+    db_writer = DatabaseWriter(progress_callback, snapshot=import_snapshot, incremental=incremental, timings=timings)
+    logging.info(f"Writing the valid rows of import {source_id} to the database again")
+
+    rows = 0
+    if cached['valid_file']:
+        path = os.path.join(app.config['DOWNLOAD_FOLDER'], cached['valid_file'])
+        with metrics.bind(timings), Pipeline(queue_size=app.config['PIPELINE_QUEUE_SIZE']) as pipeline:
+            db_stage = pipeline.stage('db-writer', db_writer.consume, workers=db_workers or app.config['DB_WORKERS'])
+            reader = read_report(path, cached['report_format'], chunk_size)
+            for index, df_validos in enumerate(reader):
+                rows += len(df_validos)
+                if progress_callback:
+                    progress_callback('validation', rows, cached['valid_records'])
+                parts = list(_partition_by_login(df_validos, db_stage.workers)) if len(df_validos) > 0 else []
+                db_writer.add_chunk(index, len(parts), len(df_validos))
+                for worker, users in parts:
+                    db_stage.put((index, users), worker)
+            if progress_callback:
+                progress_callback('validation_done', rows, rows)
+
+    processed_count, inserted_count, updated_count, skipped_count, inserted_meta, updated_meta = db_writer.totals
+    logging.info(f"Resync of {source_id}: {processed_count} users (inserted: {inserted_count}, updated: {updated_count}, skipped: {skipped_count})")
+    if db_writer.errors:
+        logging.error(f"Database insertion errors: {db_writer.errors}")
+    metrics.IMPORTS.labels(status='done').inc()
+    return dict(
+        cached,
+        processed_to_db=processed_count,
+        inserted_to_db=inserted_count,
+        updated_to_db=updated_count,
+        skipped_to_db=skipped_count,
+        inserted_meta=inserted_meta,
+        updated_meta=updated_meta,
+        incremental=incremental,
+        unchanged_skipped=db_writer.unchanged,
+        db_insert_errors=db_writer.errors,
+        resynced_from=source_id,
+        imported_at=datetime.fromtimestamp(source['updated_at']).strftime('%d/%m/%Y %H:%M'),
+        timings=timings.as_dict(rows, 0),
+    )
+
+def resume_interrupted_jobs():
+    """Queue again the imports that were queued or running when the server stopped"""
+    for job in job_store.unfinished():
+        if job['options'].get('streamed'):
+            job_store.fail(job['job_id'], "La importación se interrumpió mientras se subía el archivo. Vuelve a subirlo.")
+            # The partial reports it wrote before the restart are only cleaned up once indexed
+            _register_reports(job['job_id'], job['options'])
+            continue
+        if not job['options'].get('resync_from') and not os.path.exists(job['upload_path']):
+            job_store.fail(job['job_id'], "El archivo subido ya no existe")
+            _register_reports(job['job_id'], job['options'])
+            continue
+        if job_runner.submit(job['job_id'], run_import_job, job['job_id']):
+            checkpoint = job['checkpoint']['chunk'] if job['checkpoint'] else None
+            logging.info(f"Resuming import {job['job_id']} after checkpoint {checkpoint}")
+        else:
+            logging.warning(f"Import queue full; import {job['job_id']} will be resumed on the next start")
+
+@app.route('/progress/<file_id>')
+def get_progress(file_id):
+    """Progress of a queued or running import, polled by processing.html"""
+    payload = job_runner.progress(file_id)
+    if payload is None:
+        # Finished before the last restart: only the job store knows it
+        stored = job_store.get(file_id)
+        if stored is None or stored['status'] not in ('done', 'error'):
+            return jsonify({'error': 'Proceso no encontrado'}), 404
+        payload = {'phase': stored['status'], 'validation_finished': True, 'validation_percent': 100.0, 'db_percent': 100.0}
+        if stored['error']:
+            payload['error'] = stored['error']
+    return jsonify(payload)
+
+@app.route('/results/<file_id>')
+def show_results(file_id):
+    """Results page for a finished import"""
+    job = job_runner.get(file_id)
+    if job is None:
+        stored = job_store.get(file_id)
+        if stored is not None and stored['status'] in ('done', 'error'):
+            job = {'phase': stored['status'], 'results': stored['results'], 'error': stored['error']}
+    if job is None:
+        flash('Resultados no encontrados o caducados', 'error')
+        return redirect(url_for('index'))
+    if job['phase'] == 'error':
+        flash(f'Error al procesar el archivo: {job["error"]}', 'error')
+        return redirect(url_for('index'))
+    if job['phase'] != 'done':
+        return render_template('processing.html', file_id=file_id)
+    # Reports the retention manager deleted since are no longer offered for download
+    results = dict(job['results'])
+    folder = app.config['DOWNLOAD_FOLDER']
+    expired = [key for key in REPORT_KEYS
+               if results.get(key) and not os.path.exists(os.path.join(folder, results[key]))]
+    results.update({key: None for key in expired}, reports_expired=len(expired))
+    return render_template('results.html', results=results, file_id=file_id)
+
+def report_names(file_id, timestamp, report_format):
+    """Names of the valid, invalid, warning, duplicate and change reports of an import"""
+    return [report_filename(f"{file_id}_usuarios_{kind}_{timestamp}", report_format)
+            for kind in ('validos', 'invalidos', 'advertencias', 'duplicados', 'cambios')]
+
+def process_csv_file(file_path, file_id, progress_callback=None, db_workers=None, validation_workers=None,
+                     incremental=False, report_format=None, chunk_size=None, timestamp=None,
+                     resume=None, on_checkpoint=None, deduplicator=None, dry_run=False, db_batch_size=None):
+    """Process CSV file and validate data; file_path is a path or a binary file object such as an UploadStream"""
     try:
         logging.info(f"Starting to process CSV file: {file_path}")
 
-        # Read CSV file
-        df = pd.read_csv(file_path, sep=';', encoding='utf-8-sig')
-        # Normalize column names to lowercase
-        df.columns = df.columns.str.lower()
-        logging.info(f"CSV loaded successfully. Total records: {len(df)}")
-        logging.info(f"Columns found: {list(df.columns)}")
-        if len(df) > 0:
-            logging.info(f"Sample row: {df.iloc[0].to_dict()}")
-        
+        # Generate output files
+        report_format = report_format or app.config['REPORT_FORMAT']
+        timestamp = timestamp or datetime.now().strftime("%Y%m%d_%H%M%S")
+        chunk_size = chunk_size or app.config['CSV_CHUNK_SIZE']
+        valid_filename, invalid_filename, warning_filename, duplicate_filename, change_filename = \
+            report_names(file_id, timestamp, report_format)
 
-        # Lists for valid and invalid records
-        validos = []
-        no_validos = []
-        warnings = []
-
-        # Process each row
-        total_rows = len(df)
-        for idx, fila in df.iterrows():
-            if idx % 100 == 0:
-                logging.info(f"Processing row {idx + 1}/{total_rows}")
-
-            # add new column old_user
-            fila['old_user'] = 1
-
-            # Clean phone number
-            raw_telefono = fila.get('telefono', '')
-            logging.info(f"Raw telefono for row {idx}: '{raw_telefono}'")
-            fila['telefono'] = limpiar_y_elegir_telefono(raw_telefono)
-            logging.info(f"Cleaned telefono for row {idx}: '{fila['telefono']}'")
-            
-            # Validate DNI/NIE/CIF
-            dni = str(fila.get('dni', '')).strip()
-            dni_valido, motivo_dni = validar_identificador(dni)
-            
-            # Validate email if present using new regex function
-            email_valido = True
-            motivo_email = ""
-            email_normalizado = ""
-            email_original = ""
-
-            from validators import validar_email_Regex
-            email_valido, motivo_email, email_normalizado, email_original = validar_email_Regex(fila.get('email', ''))
-            # Always update the email field with normalized/corrected version
-            fila['email'] = email_normalizado
-
-            # Determine record status
-            if dni_valido:
-                # DNI is valid, add to validos
-                validos.append(fila.copy())
-                
-                # If email is invalid, also add to warnings
-                if not email_valido :
-                    fila_warning = fila.copy()
-                    fila_warning['email_original'] = email_original
-                    fila_warning['motivo_warning'] = f"Email: {motivo_email}"
-                    warnings.append(fila_warning)
-            else:
-                # DNI is invalid, add to no_validos
-                fila_con_motivo = fila.copy()
-                motivos = [f"DNI: {motivo_dni}"]
-                
-                if not email_valido:
-                    motivos.append(f"Email: {motivo_email}")
-                
-                fila_con_motivo['motivo_invalido'] = "; ".join(motivos)
-                no_validos.append(fila_con_motivo)
-        
-        # Create DataFrames
-        df_validos = pd.DataFrame(validos)
-        df_no_validos = pd.DataFrame(no_validos)
-        df_warnings = pd.DataFrame(warnings)
+        valid_report = ReportWriter(os.path.join(app.config['DOWNLOAD_FOLDER'], valid_filename), report_format)
+        invalid_report = ReportWriter(os.path.join(app.config['DOWNLOAD_FOLDER'], invalid_filename), report_format)
+        warning_report = ReportWriter(os.path.join(app.config['DOWNLOAD_FOLDER'], warning_filename), report_format)
+        duplicate_report = ReportWriter(os.path.join(app.config['DOWNLOAD_FOLDER'], duplicate_filename), report_format)
+        change_report = ReportWriter(os.path.join(app.config['DOWNLOAD_FOLDER'], change_filename), report_format)
+        change_lock = threading.Lock()
+
+        def write_changes(changes):
+            # Called by every DB worker on a dry run
+            with change_lock, metrics.timed('reports'):
+                change_report.write(pd.DataFrame(changes, columns=CHANGE_COLUMNS))
+
+        if isinstance(file_path, str):
+            total_bytes = os.path.getsize(file_path)
+            source = open(file_path, 'rb')
+            source_name = file_path
+        else:
+            # A binary file object, such as an upload that is still arriving
+            total_bytes = getattr(file_path, 'size', None)
+            source = file_path
+            source_name = None
+        deduplicator = deduplicator or Deduplicator(app.config['DEDUP_RULE'])
+        total_rows = 0
+        columns = []
+        invalid_reasons = Counter()
+        warning_reasons = Counter()
+        timings = metrics.ImportTimings()
+        if dry_run:
+            # The change report is rebuilt from scratch, so there is nothing to resume from
+            resume, on_checkpoint = None, None
+        db_writer = DatabaseWriter(progress_callback, snapshot=import_snapshot, incremental=incremental, timings=timings,
+                                   on_checkpoint=on_checkpoint, batch_size=db_batch_size,
+                                   on_changes=write_changes if dry_run else None)
+        committed_chunk = -1
+        # resume: the last on_checkpoint() state of an earlier run with the same chunk_size and timestamp
+        if resume:
+            db_writer.restore(resume)
+            committed_chunk = resume['chunk']
+            logging.info(f"Resuming import {file_id}: chunks up to {committed_chunk} are already in the database")
+        db_workers = db_workers or app.config['DB_WORKERS']
+        validation_workers = validation_workers or app.config['VALIDATION_WORKERS']
+
+        def write_reports(parts):
+            with metrics.bind(timings):
+                for df_validos, df_no_validos, df_warnings, df_duplicados in parts:
+                    with metrics.timed('reports'):
+                        valid_report.write(df_validos)
+                        invalid_report.write(df_no_validos)
+                        warning_report.write(df_warnings)
+                        duplicate_report.write(df_duplicados)
+
+        with metrics.bind(timings), source, valid_report, invalid_report, warning_report, duplicate_report, change_report:
+            if deduplicator.needs_plan and not deduplicator.is_planned(source_name) and source.seekable():
+                # The last or most complete row of a DNI may come later in the file: find them first
+                with metrics.timed('dedup'):
+                    deduplicator.plan(_read_chunks(source, chunk_size), source_name)
+                source.seek(0)
+
+            with Pipeline(queue_size=app.config['PIPELINE_QUEUE_SIZE']) as pipeline:
+                db_stage = pipeline.stage('db-writer', db_writer.consume, workers=db_workers)
+                report_stage = pipeline.stage('report-writer', write_reports)
+
+                # Validate each chunk column-wise (DNI/NIE/CIF, phone cleaning, email)
+                chunks = _read_chunks(source, chunk_size)
+                validated = _validate_chunks(chunks, validation_workers)
+                for index, (chunk, (df_validos, df_no_validos, df_warnings)) in enumerate(validated):
+                    if total_rows == 0:
+                        columns = list(chunk.columns)
+                        logging.info(f"Columns found: {columns}")
+                        if len(chunk) > 0:
+                            logging.info(f"Sample row: {chunk.iloc[0].to_dict()}")
 
-        # Insert valid users into database
-        processed_count, inserted_count, updated_count, skipped_count, inserted_meta, updated_meta, insert_errors = insert_valid_users_to_db(validos)
+                    if ROW_TRACE_SAMPLE > 0:
+                        trace_rows(chunk, df_validos, df_no_validos, df_warnings, ROW_TRACE_SAMPLE)
+
+                    total_rows += len(chunk)
+                    if progress_callback:
+                        # Row count is unknown until the end; estimate it from the bytes read so far
+                        bytes_read = max(source.tell(), 1)
+                        estimated_rows = max(total_rows, int(total_rows * (total_bytes or bytes_read) / bytes_read))
+                        progress_callback('validation', total_rows, estimated_rows)
+
+                    # Keep one row per DNI; also on resume, so the same rows are dropped as in the first run
+                    with metrics.timed('dedup'):
+                        df_validos, df_duplicados = deduplicator.split(df_validos, chunk, source_name)
+
+                    # Hand the chunk to the DB writers (unless a previous run committed it) and the report writer
+                    if index > committed_chunk:
+                        parts = list(_partition_by_login(df_validos, db_stage.workers)) if len(df_validos) > 0 else []
+                        db_writer.add_chunk(index, len(parts), len(df_validos))
+                        for worker, users in parts:
+                            db_stage.put((index, users), worker)
+                    report_stage.put((df_validos, df_no_validos, df_warnings, df_duplicados))
+
+                    invalid_reasons.update(df_no_validos['motivo_invalido'].value_counts().to_dict())
+                    warning_reasons.update(df_warnings['motivo_warning'].value_counts().to_dict())
+
+                if progress_callback:
+                    # The database writers may still be busy with the last chunks
+                    progress_callback('validation_done', total_rows, total_rows)
+
+        db_totals = db_writer.totals
+        insert_errors = db_writer.errors
+        processed_count, inserted_count, updated_count, skipped_count, inserted_meta, updated_meta = db_totals
+        logging.info(f"CSV processed: {total_rows} records, {valid_report.rows} valid, {invalid_report.rows} invalid, {warning_report.rows} warnings")
+        if duplicate_report.rows:
+            logging.info(f"Dropped {duplicate_report.rows} rows with a repeated DNI (rule: {deduplicator.rule})")
         logging.info(f"Processed {processed_count} users into database (inserted: {inserted_count}, updated: {updated_count}, skipped: {skipped_count})")
         logging.info(f"Meta operations: inserted {inserted_meta}, updated {updated_meta}")
+        if incremental:
+            logging.info(f"Incremental import: {db_writer.unchanged} unchanged users not sent to the database")
+        if dry_run:
+            logging.info(f"Dry run: nothing written; {change_report.rows} users would be inserted or changed")
         if insert_errors:
             logging.error(f"Database insertion errors: {insert_errors}")
-        
-        # Generate output files
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        valid_filename = f"usuarios_validos_{timestamp}.csv"
-        invalid_filename = f"usuarios_invalidos_{timestamp}.csv"
-        warning_filename = f"usuarios_advertencias_{timestamp}.csv"
-
-        valid_path = os.path.join(app.config['DOWNLOAD_FOLDER'], f"{file_id}_{valid_filename}")
-        invalid_path = os.path.join(app.config['DOWNLOAD_FOLDER'], f"{file_id}_{invalid_filename}")
-        warning_path = os.path.join(app.config['DOWNLOAD_FOLDER'], f"{file_id}_{warning_filename}")
-        
-        # Save files
-        if len(df_validos) > 0:
-            df_validos.to_csv(valid_path, sep=';', index=False, encoding='utf-8-sig')
-        
-        if len(df_no_validos) > 0:
-            df_no_validos.to_csv(invalid_path, sep=';', index=False, encoding='utf-8-sig')
 
-        if len(df_warnings) > 0:
-            df_warnings.to_csv(warning_path, sep=';', index=False, encoding='utf-8-sig')
+        report_bytes = sum(
+            os.path.getsize(report.path)
+            for report in (valid_report, invalid_report, warning_report, duplicate_report, change_report)
+            if report.rows > 0
+        )
+        metrics.IMPORTS.labels(status='done').inc()
+        metrics.IMPORT_ROWS.labels(result='valid').inc(valid_report.rows)
+        metrics.IMPORT_ROWS.labels(result='invalid').inc(invalid_report.rows)
+        metrics.IMPORT_ROWS.labels(result='warning').inc(warning_report.rows)
+        metrics.IMPORT_ROWS.labels(result='duplicate').inc(duplicate_report.rows)
+        metrics.REPORT_BYTES.inc(report_bytes)
+        import_timings = timings.as_dict(total_rows, report_bytes)
+        logging.info(f"Import timings: {import_timings}")
+
+        logging.info(f"Validation cache: {estadisticas_caches()}")
+        if app.config['VALIDATION_CACHE_PATH']:
+            try:
+                guardar_caches(app.config['VALIDATION_CACHE_PATH'])
+            except OSError as e:
+                logging.warning(f"Could not save validation cache: {str(e)}")
 
         # Prepare results
         results = {
-            'total_records': len(df),
-            'valid_records': len(df_validos),
-            'invalid_records': len(df_no_validos),
-            'warning_records': len(df_warnings),
+            'total_records': total_rows,
+            'valid_records': valid_report.rows,
+            'invalid_records': invalid_report.rows,
+            'warning_records': warning_report.rows,
+            'duplicate_records': duplicate_report.rows,
             'processed_to_db': processed_count,
             'inserted_to_db': inserted_count,
             'updated_to_db': updated_count,
             'skipped_to_db': skipped_count,
             'inserted_meta': inserted_meta,
             'updated_meta': updated_meta,
+            'incremental': incremental,
+            'dry_run': dry_run,
+            'unchanged_skipped': db_writer.unchanged,
             'db_insert_errors': insert_errors,
-            'valid_file': f"{file_id}_{valid_filename}" if len(df_validos) > 0 else None,
-            'invalid_file': f"{file_id}_{invalid_filename}" if len(df_no_validos) > 0 else None,
-            'warning_file': f"{file_id}_{warning_filename}" if len(df_warnings) > 0 else None,
-            'columns': list(df.columns),
-            'invalid_reasons': df_no_validos['motivo_invalido'].value_counts().to_dict() if len(df_no_validos) > 0 else {},
-            'warning_reasons': df_warnings['motivo_warning'].value_counts().to_dict() if len(df_warnings) > 0 else {}
+            'valid_file': valid_filename if valid_report.rows > 0 else None,
+            'invalid_file': invalid_filename if invalid_report.rows > 0 else None,
+            'warning_file': warning_filename if warning_report.rows > 0 else None,
+            'duplicate_file': duplicate_filename if duplicate_report.rows > 0 else None,
+            'change_records': change_report.rows,
+            'change_file': change_filename if change_report.rows > 0 else None,
+            'dedup_rule': deduplicator.rule,
+            'report_format': report_format,
+            'columns': columns,
+            'invalid_reasons': dict(invalid_reasons.most_common()),
+            'warning_reasons': dict(warning_reasons.most_common()),
+            'timings': import_timings
         }
         
         return results
         
     except Exception as e:
+        metrics.IMPORTS.labels(status='error').inc()
         logging.error(f"Error in process_csv_file: {str(e)}")
         raise e
 
+def _send_download(filename, **kwargs):
+    """downloads.send_download for a file in DOWNLOAD_FOLDER, with the configured caching and offload"""
+    return send_download(app.config['DOWNLOAD_FOLDER'], filename, max_age=app.config['DOWNLOAD_MAX_AGE'],
+                         offload=app.config['DOWNLOAD_OFFLOAD'], accel_prefix=app.config['DOWNLOAD_ACCEL_PREFIX'],
+                         **kwargs)
+
 @app.route('/download/<filename>')
 def download_file(filename):
     """Download processed file"""
     try:
-        file_path = os.path.join(app.config['DOWNLOAD_FOLDER'], filename)
-        if os.path.exists(file_path):
-            return send_file(file_path, as_attachment=True)
-        else:
+        for suffix, (encoding, mimetype) in COMPRESSED_REPORT_ENCODINGS.items():
+            if filename.endswith(suffix):
+                if encoding in request.accept_encodings:
+                    # The browser decompresses it and saves a plain CSV
+                    response = _send_download(filename, mimetype='text/csv', content_encoding=encoding,
+                                              download_name=filename[:-len(suffix)] + '.csv')
+                else:
+                    response = _send_download(filename, mimetype=mimetype)
+                response.headers['Vary'] = 'Accept-Encoding'
+                return response
+        return _send_download(filename)
+    except FileNotFoundError:
+        flash('Archivo no encontrado', 'error')
+        return redirect(url_for('index'))
+    except HTTPException:
+        # 416 for a Range outside the file
+        raise
+    except Exception as e:
+        logging.error(f"Error downloading file: {str(e)}")
+        flash('Error al descargar el archivo', 'error')
+        return redirect(url_for('index'))
+
+@app.route('/download-all/<file_id>')
+def download_all(file_id):
+    """Download every report of an import as a single zip"""
+    try:
+        folder = app.config['DOWNLOAD_FOLDER']
+        file_id = secure_filename(file_id)
+        # The report index knows the import's files without listing the folder
+        names = [name for name in retention.files(file_id) if name.startswith(f"{file_id}_usuarios_")]
+        if not file_id or not names:
             flash('Archivo no encontrado', 'error')
             return redirect(url_for('index'))
+
+        zip_path = os.path.join(folder, f"{file_id}_informes.zip")
+        if not os.path.exists(zip_path):
+            # Build it next to the reports and rename, so a concurrent download never sees half a zip
+            fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.zip.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f, zipfile.ZipFile(f, 'w') as archive:
+                    for name in names:
+                        # Compressed reports gain nothing from deflating them again
+                        compression = zipfile.ZIP_DEFLATED if name.endswith('.csv') else zipfile.ZIP_STORED
+                        archive.write(os.path.join(folder, name), arcname=name, compress_type=compression)
+                os.replace(tmp_path, zip_path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+            retention.register(file_id, [os.path.basename(zip_path)])
+        return _send_download(os.path.basename(zip_path), mimetype='application/zip')
+    except HTTPException:
+        raise
     except Exception as e:
-        logging.error(f"Error downloading file: {str(e)}")
+        logging.error(f"Error building zip for {file_id}: {str(e)}")
         flash('Error al descargar el archivo', 'error')
         return redirect(url_for('index'))
 
 @app.errorhandler(413)
 def too_large(e):
     """Handle file too large error"""
-    flash('El archivo es demasiado grande. Máximo 16MB permitido.', 'error')
+    max_mb = app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+    flash(f'El archivo es demasiado grande. Máximo {max_mb}MB permitido.', 'error')
     return redirect(url_for('index'))
 
 if __name__ == '__main__':
+    # The debug reloader runs this module twice; only the child process serves requests
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        retention.start()
+        resume_interrupted_jobs()
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Generador de CSV sintéticos para los benchmarks de importación.
+
+Produce archivos separados por punto y coma con el mismo formato que
+ejemplo_datos.csv: DNI/NIE/CIF válidos e inválidos, teléfonos con formatos
+variados, emails incorrectos y usuarios repetidos. Escribe fila a fila, así
+que sirve para archivos de millones de filas sin cargarlos en memoria.
+
+Uso:
+    python benchmarks/generate_data.py datos.csv --rows 100000 --seed 1
+"""
+
+import argparse
+import csv
+import random
+
+LETRAS_DNI = "TRWAGMYFPDXBNJZSQVHLCKE"
+LETRAS_CONTROL_CIF = "JABCDEFGHI"
+
+NOMBRES = ["Juan", "María", "José", "Ana", "Carlos", "Lucía", "Javier", "Carmen", "Iñaki", "Nerea", "Pablo", "Elena"]
+APELLIDOS = ["García", "López", "Pérez", "Martínez", "Sánchez", "Gómez", "Ruiz", "Etxeberria", "Núñez", "Ortiz"]
+CIUDADES = ["Madrid", "Barcelona", "Vitoria-Gasteiz", "Bilbao", "Sevilla", "Valencia", "Zaragoza", ""]
+DOMINIOS = ["gmail.com", "hotmail.com", "yahoo.es", "email.com", "correo.es", "euskaltel.net"]
+
+
+def dni(r):
+    numero = r.randrange(10**8)
+    return f"{numero:08d}{LETRAS_DNI[numero % 23]}"
+
+
+def nie(r):
+    prefijo = r.choice("XYZ")
+    numero = r.randrange(10**7)
+    return f"{prefijo}{numero:07d}{LETRAS_DNI[int('XYZ'.index(prefijo) * 10**7 + numero) % 23]}"
+
+
+def cif(r):
+    letra = r.choice("ABEHPQRSNWCDFGJUV")
+    digitos = [r.randrange(10) for _ in range(7)]
+    suma_pares = sum(digitos[i] for i in (1, 3, 5))
+    suma_impares = sum(d * 2 // 10 + d * 2 % 10 for d in (digitos[i] for i in (0, 2, 4, 6)))
+    control = (10 - (suma_pares + suma_impares) % 10) % 10
+    if letra in "PQRSNW":
+        final = LETRAS_CONTROL_CIF[control]
+    elif letra in "ABEH":
+        final = str(control)
+    else:
+        final = r.choice([str(control), LETRAS_CONTROL_CIF[control]])
+    return letra + "".join(map(str, digitos)) + final
+
+
+def identificador(r):
+    k = r.random()
+    if k < 0.70:
+        valor = dni(r)
+    elif k < 0.80:
+        valor = nie(r)
+    elif k < 0.85:
+        valor = cif(r)
+    elif k < 0.93:
+        # Letra de control incorrecta
+        valor = dni(r)
+        valor = valor[:-1] + r.choice(LETRAS_DNI.replace(valor[-1], ""))
+    else:
+        valor = r.choice(["", "1234567", "X123", "INVALIDO", "123456789", "12.345.678-Z"])
+    if r.random() < 0.05:
+        valor = f" {valor.lower()} "
+    return valor
+
+
+def movil(r):
+    return r.choice("67") + "".join(r.choice("0123456789") for _ in range(8))
+
+
+def fijo(r):
+    return r.choice("89") + "".join(r.choice("0123456789") for _ in range(8))
+
+
+def telefono(r):
+    k = r.random()
+    if k < 0.55:
+        return movil(r)
+    if k < 0.65:
+        return fijo(r)
+    if k < 0.72:
+        numero = movil(r)
+        return f"{numero[:3]} {numero[3:6]} {numero[6:]}"
+    if k < 0.78:
+        return f"+34 {movil(r)}"
+    if k < 0.84:
+        return f"{fijo(r)} / {movil(r)}"
+    if k < 0.88:
+        return f"{movil(r)}.0"
+    if k < 0.92:
+        numero = fijo(r)
+        return f"{numero[:2]}-{numero[2:5]}-{numero[5:7]}-{numero[7:]}"
+    if k < 0.97:
+        return ""
+    return r.choice(["123", "no tiene", "00000", "6666"])
+
+
+def email(r, nombre, apellido):
+    usuario = f"{nombre}.{apellido}{r.randrange(1000)}".lower()
+    usuario = usuario.replace("á", "a").replace("é", "e").replace("í", "i").replace("ó", "o").replace("ú", "u")
+    k = r.random()
+    if k < 0.75:
+        return f"{usuario.replace('ñ', 'n')}@{r.choice(DOMINIOS)}"
+    if k < 0.79:
+        return f" {usuario.replace('ñ', 'n').upper()}@{r.choice(DOMINIOS).upper()} "
+    if k < 0.83:
+        return f"{usuario}@{r.choice(DOMINIOS)}"  # puede contener ñ
+    if k < 0.87:
+        return f"{usuario.replace('ñ', 'n')}@{r.choice(DOMINIOS)} / otro@{r.choice(DOMINIOS)}"
+    if k < 0.92:
+        return ""
+    return r.choice([usuario, f"{usuario}@", f"{usuario}@dominio", f"@{r.choice(DOMINIOS)}", "sin email"])
+
+
+def persona(r):
+    nombre = r.choice(NOMBRES)
+    apellido = r.choice(APELLIDOS)
+    return [identificador(r), telefono(r), email(r, nombre, apellido), nombre,
+            f"{apellido} {r.choice(APELLIDOS)}", r.choice(CIUDADES)]
+
+
+def generar(ruta, filas, semilla=1, repetidos=0.05):
+    """Escribe filas usuarios en ruta; una fracción repetidos repite a alguien anterior"""
+    r = random.Random(semilla)
+    recientes = []
+    with open(ruta, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f, delimiter=";")
+        writer.writerow(["dni", "telefono", "email", "nombre", "apellidos", "ciudad"])
+        for _ in range(filas):
+            if recientes and r.random() < repetidos:
+                fila = list(r.choice(recientes))
+                if r.random() < 0.5:
+                    # Mismo usuario con datos de contacto actualizados
+                    fila[1] = telefono(r)
+                    fila[2] = email(r, fila[3], fila[4].split()[0])
+            else:
+                fila = persona(r)
+                if len(recientes) < 10000:
+                    recientes.append(fila)
+                else:
+                    recientes[r.randrange(len(recientes))] = fila
+            writer.writerow(fila)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera un CSV sintético de usuarios para los benchmarks")
+    parser.add_argument("salida", help="Ruta del CSV a generar")
+    parser.add_argument("--rows", type=int, default=100000, help="Número de filas (por defecto 100000)")
+    parser.add_argument("--seed", type=int, default=1, help="Semilla, para generar siempre el mismo archivo")
+    parser.add_argument("--duplicates", type=float, default=0.05, help="Fracción de filas que repiten un usuario")
+    args = parser.parse_args()
+
+    generar(args.salida, args.rows, args.seed, args.duplicates)
+    print(f"Generado {args.salida} con {args.rows} filas")
+
+
+if __name__ == "__main__":
+    main()
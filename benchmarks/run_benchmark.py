@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Benchmark de las fases de importación: lectura del CSV, validación, escritura
+de informes y, opcionalmente, escritura en base de datos.
+
+Cada fase se mide por separado sobre los mismos bloques de CSV_CHUNK_SIZE
+filas que usa la aplicación, y el resultado se guarda en JSON para comparar
+versiones (--baseline muestra la diferencia con una ejecución anterior).
+
+La fase de base de datos ESCRIBE en wp_users/wp_usermeta de la base de datos
+indicada en BENCH_DB_HOST, BENCH_DB_PORT, BENCH_DB_USER, BENCH_DB_PASSWORD y
+BENCH_DB_NAME, que debe ser una MariaDB de pruebas: nunca usa la conexión de la
+aplicación (DB_*), y --db se niega a funcionar sin esas variables o si apuntan
+a la misma base de datos. Las consultas usan sintaxis de MariaDB
+(UPDATE ... JOIN, NOW()), así que no hay un sustituto SQLite.
+
+Uso:
+    python benchmarks/generate_data.py datos.csv --rows 1000000
+    python benchmarks/run_benchmark.py datos.csv [--db] [--baseline anterior.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(REPO_DIR)
+
+import pandas as pd
+
+from app import app, write_users_batch, _read_chunks
+from db import open_database_connection
+from reports import ReportWriter, available_formats, report_filename
+from validators import validar_dataframe, configurar_caches, estadisticas_caches
+
+
+# Only these settings are used for --db, so a benchmark never writes to the app's database
+BENCH_DB_PREFIX = 'BENCH_DB_'
+BENCH_DB_REQUIRED = ('HOST', 'USER', 'NAME')
+
+
+def bench_db_problem():
+    """Why --db cannot run with the current environment, or None"""
+    missing = [BENCH_DB_PREFIX + name for name in BENCH_DB_REQUIRED if not os.getenv(BENCH_DB_PREFIX + name)]
+    if missing:
+        return f"--db necesita una base de datos de pruebas: define {', '.join(missing)}"
+
+    def target(prefix):
+        return os.getenv(prefix + 'HOST'), os.getenv(prefix + 'PORT', '3306'), os.getenv(prefix + 'NAME')
+    if target(BENCH_DB_PREFIX) == target('DB_'):
+        return "BENCH_DB_* apunta a la misma base de datos que la aplicación (DB_*): usa una de pruebas"
+    return None
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class PhaseTimer:
+    """Acumula segundos y filas por fase"""
+
+    def __init__(self):
+        self.phases = {}
+
+    def measure(self, name, rows, func, *args):
+        started = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - started
+        phase = self.phases.setdefault(name, {'seconds': 0.0, 'rows': 0})
+        phase['seconds'] += elapsed
+        phase['rows'] += rows
+        return result
+
+    def summary(self):
+        return {
+            name: {
+                'seconds': round(phase['seconds'], 4),
+                'rows': phase['rows'],
+                'rows_per_second': round(phase['rows'] / phase['seconds'], 1) if phase['seconds'] else None,
+            }
+            for name, phase in self.phases.items()
+        }
+
+
+def run(csv_path, chunk_size, with_db, output_dir, report_format='csv'):
+    timer = PhaseTimer()
+    counts = {'total': 0, 'valid': 0, 'invalid': 0, 'warnings': 0,
+              'db_processed': 0, 'db_inserted': 0, 'db_updated': 0, 'db_skipped': 0, 'db_errors': 0}
+
+    connection = open_database_connection(BENCH_DB_PREFIX) if with_db else None
+    started = time.perf_counter()
+    try:
+        with open(csv_path, 'rb') as source, \
+                ReportWriter(os.path.join(output_dir, report_filename('validos', report_format)),
+                             report_format) as valid_report, \
+                ReportWriter(os.path.join(output_dir, report_filename('invalidos', report_format)),
+                             report_format) as invalid_report, \
+                ReportWriter(os.path.join(output_dir, report_filename('advertencias', report_format)),
+                             report_format) as warning_report:
+            chunks = _read_chunks(source, chunk_size)
+            while True:
+                chunk = timer.measure('parse', 0, next, chunks, None)
+                if chunk is None:
+                    break
+                timer.phases['parse']['rows'] += len(chunk)
+                counts['total'] += len(chunk)
+
+                df_validos, df_no_validos, df_warnings = timer.measure('validation', len(chunk), validar_dataframe, chunk)
+                counts['valid'] += len(df_validos)
+                counts['invalid'] += len(df_no_validos)
+                counts['warnings'] += len(df_warnings)
+
+                def write_reports():
+                    valid_report.write(df_validos)
+                    invalid_report.write(df_no_validos)
+                    warning_report.write(df_warnings)
+                timer.measure('reports', len(chunk), write_reports)
+
+                if connection is not None and len(df_validos) > 0:
+                    def write_db():
+                        with connection.cursor() as cursor:
+                            result = write_users_batch(cursor, df_validos.to_dict('records'))
+                        connection.commit()
+                        return result
+                    processed, inserted, updated, skipped, _, _, errors = timer.measure('db', len(df_validos), write_db)
+                    counts['db_processed'] += processed
+                    counts['db_inserted'] += inserted
+                    counts['db_updated'] += updated
+                    counts['db_skipped'] += skipped
+                    counts['db_errors'] += len(errors)
+    finally:
+        if connection is not None:
+            connection.close()
+
+    total_seconds = time.perf_counter() - started
+    report_bytes = sum(os.path.getsize(os.path.join(output_dir, name)) for name in os.listdir(output_dir))
+
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'file': os.path.basename(csv_path),
+        'file_bytes': os.path.getsize(csv_path),
+        'chunk_size': chunk_size,
+        'with_db': with_db,
+        'report_format': report_format,
+        'total_seconds': round(total_seconds, 4),
+        'rows_per_second': round(counts['total'] / total_seconds, 1) if total_seconds else None,
+        'report_bytes': report_bytes,
+        'phases': timer.summary(),
+        'counts': counts,
+        'validation_cache': estadisticas_caches(),
+    }
+
+
+def print_results(results, baseline=None):
+    print(f"\n{results['counts']['total']} filas en {results['total_seconds']:.2f}s "
+          f"({results['rows_per_second']} filas/s)")
+    for name, phase in results['phases'].items():
+        line = f"  {name:<11} {phase['seconds']:>9.3f}s  {phase['rows_per_second'] or 0:>12.1f} filas/s"
+        previous = (baseline or {}).get('phases', {}).get(name)
+        if previous and previous['seconds']:
+            change = (phase['seconds'] - previous['seconds']) / previous['seconds'] * 100
+            line += f"  ({change:+.1f}% frente a {baseline.get('git_commit') or 'la referencia'})"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mide las fases de importación de un CSV")
+    parser.add_argument('csv', help="CSV a importar (ver benchmarks/generate_data.py)")
+    parser.add_argument('--chunk-size', type=int, default=app.config['CSV_CHUNK_SIZE'],
+                        help="Filas por bloque (por defecto CSV_CHUNK_SIZE)")
+    parser.add_argument('--db', action='store_true',
+                        help="Medir también la escritura en la base de datos de pruebas de BENCH_DB_* (¡escribe en ella!)")
+    parser.add_argument('--format', default='csv', choices=available_formats(),
+                        help="Formato de los informes (por defecto csv)")
+    parser.add_argument('--no-cache', action='store_true', help="Desactivar la caché de validación")
+    parser.add_argument('--output', help="JSON de resultados (por defecto benchmarks/results/<fecha>.json)")
+    parser.add_argument('--baseline', help="JSON de una ejecución anterior con el que comparar")
+    args = parser.parse_args()
+    if args.db:
+        problem = bench_db_problem()
+        if problem:
+            parser.error(problem)
+
+    if args.no_cache:
+        configurar_caches(0)
+
+    with tempfile.TemporaryDirectory(prefix='csv_benchmark_') as output_dir:
+        results = run(args.csv, args.chunk_size, args.db, output_dir, args.format)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    output = args.output or os.path.join(REPO_DIR, 'benchmarks', 'results',
+                                         f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"\nResultados guardados en {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,8 @@
 #!/usr/bin/env python3
-import pymysql
-from dotenv import load_dotenv
-import os
-
-load_dotenv()
+from db import open_database_connection
 
 try:
-    conn = pymysql.connect(
-        host=os.getenv('DB_HOST'),
-        port=int(os.getenv('DB_PORT', 3306)),
-        user=os.getenv('DB_USER'),
-        password=os.getenv('DB_PASSWORD'),
-        database=os.getenv('DB_NAME')
-    )
+    conn = open_database_connection()
 
     with conn.cursor() as cursor:
         # Verificar el ultimo usuario
@@ -21,17 +11,17 @@ try:
 
         if result:
             print(f"Usuario encontrado:")
-            print(f"  ID: {result[0]}")
-            print(f"  Login: {result[1]}")
-            print(f"  Email: {result[2]}")
-            print(f"  Display Name: {result[3]}")
-            print(f"  Registrado: {result[4]}")
+            print(f"  ID: {result['ID']}")
+            print(f"  Login: {result['user_login']}")
+            print(f"  Email: {result['user_email']}")
+            print(f"  Display Name: {result['display_name']}")
+            print(f"  Registrado: {result['user_registered']}")
         else:
             print("Usuario 69338576Q NO encontrado en la base de datos")
 
         # Verificar total de usuarios
-        cursor.execute("SELECT COUNT(*) FROM wp_users")
-        total = cursor.fetchone()[0]
+        cursor.execute("SELECT COUNT(*) AS total FROM wp_users")
+        total = cursor.fetchone()['total']
         print(f"\nTotal de usuarios en wp_users: {total}")
 
     conn.close()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Importación de CSV desde la línea de órdenes, con el mismo proceso que la web:
+validación por bloques, informes en DOWNLOAD_FOLDER y escritura en la base de
+datos configurada en .env. Sin límite de tamaño de subida ni timeouts de
+Gunicorn, así que sirve para importaciones programadas de archivos grandes.
+
+Los archivos se importan uno tras otro en el orden indicado (los de una
+carpeta, por nombre). Los DNI repetidos se eliminan también entre archivos.
+
+Uso:
+    python cli.py datos.csv [otro.csv carpeta/ ...] [--workers 4] [--batch-size 1000] [--dry-run] [--json]
+
+Con --dry-run no se escribe nada: cada lote se compara con wp_users/wp_usermeta
+y se genera un informe con los usuarios que se insertarían o cambiarían.
+
+Devuelve 1 si algún archivo no se pudo importar o tuvo errores de base de datos.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from datetime import datetime
+
+from werkzeug.utils import secure_filename
+
+from app import app, db_pool, process_csv_file, report_names, retention, _read_chunks
+from dedup import DEDUP_RULES, Deduplicator
+from reports import available_formats
+
+# Seconds between progress lines
+PROGRESS_INTERVAL = 5
+
+PHASE_LABELS = {'validation': 'validación', 'validation_done': 'validación terminada', 'db_insert': 'base de datos'}
+
+
+def find_csv_files(paths):
+    """Expand the given files and directories (their *.csv files, by name) into a list of files"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                if name.lower().endswith('.csv') and os.path.isfile(os.path.join(path, name))))
+        elif os.path.isfile(path):
+            files.append(path)
+        else:
+            raise FileNotFoundError(f"No existe: {path}")
+    return files
+
+
+def progress_printer(name):
+    """progress_callback for process_csv_file that prints a line every PROGRESS_INTERVAL seconds"""
+    last = {}
+
+    def report(phase, done, total):
+        now = time.monotonic()
+        if now - last.get(phase, 0) >= PROGRESS_INTERVAL:
+            last[phase] = now
+            print(f"{name}: {PHASE_LABELS.get(phase, phase)} {done}/{total}", file=sys.stderr, flush=True)
+
+    return report
+
+
+def print_summary(path, results, output_dir):
+    print(f"\n{path}: {results['total_records']} filas, {results['valid_records']} válidas, "
+          f"{results['invalid_records']} inválidas, {results['warning_records']} con advertencias, "
+          f"{results['duplicate_records']} duplicadas")
+    if results['dry_run']:
+        print(f"  Simulación, sin escribir nada: se insertarían {results['inserted_to_db']} y se actualizarían "
+              f"{results['updated_to_db']}; {results['skipped_to_db']} sin cambios en wp_users, "
+              f"{results['updated_meta']} teléfonos distintos, {len(results['db_insert_errors'])} errores")
+    else:
+        print(f"  Base de datos: {results['inserted_to_db']} insertados, {results['updated_to_db']} actualizados, "
+              f"{results['skipped_to_db']} sin cambios, {len(results['db_insert_errors'])} errores")
+    if results['incremental']:
+        print(f"  Incremental: {results['unchanged_skipped']} sin cambios desde la última importación")
+    for error in results['db_insert_errors']:
+        print(f"    - {error}")
+    for key in ('valid_file', 'invalid_file', 'warning_file', 'duplicate_file', 'change_file'):
+        if results[key]:
+            print(f"  {os.path.join(output_dir, results[key])}")
+    print(f"  {results['timings']['total_seconds']:.1f}s ({results['timings']['rows_per_second']:.0f} filas/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Importa archivos CSV de usuarios en WordPress sin pasar por la web")
+    parser.add_argument('paths', nargs='+', help="Archivos CSV o carpetas con archivos CSV")
+    parser.add_argument('--workers', type=int, default=app.config['DB_WORKERS'],
+                        help="Hilos que escriben en la base de datos (por defecto DB_WORKERS)")
+    parser.add_argument('--validation-workers', type=int, default=app.config['VALIDATION_WORKERS'],
+                        help="Procesos de validación (por defecto VALIDATION_WORKERS)")
+    parser.add_argument('--batch-size', type=int, default=app.config['DB_BATCH_SIZE'],
+                        help="Usuarios por transacción (por defecto DB_BATCH_SIZE)")
+    parser.add_argument('--chunk-size', type=int, default=app.config['CSV_CHUNK_SIZE'],
+                        help="Filas por bloque (por defecto CSV_CHUNK_SIZE)")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="No escribir en la base de datos: calcular qué cambiaría y generar un informe de cambios")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Enviar solo los usuarios que cambiaron desde la última importación")
+    parser.add_argument('--dedup', default=app.config['DEDUP_RULE'], choices=DEDUP_RULES,
+                        help="Fila que se importa si varias tienen el mismo DNI (por defecto DEDUP_RULE)")
+    parser.add_argument('--format', default=app.config['REPORT_FORMAT'], choices=available_formats(),
+                        help="Formato de los informes (por defecto REPORT_FORMAT)")
+    parser.add_argument('--output', default=app.config['DOWNLOAD_FOLDER'],
+                        help="Carpeta de los informes (por defecto DOWNLOAD_FOLDER)")
+    parser.add_argument('--json', action='store_true', help="Escribir los resultados en JSON en lugar de texto")
+    parser.add_argument('--verbose', action='store_true', help="Mostrar el log de la aplicación")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    try:
+        files = find_csv_files(args.paths)
+    except FileNotFoundError as e:
+        parser.error(str(e))
+    if not files:
+        parser.error("No se encontró ningún archivo CSV")
+    if args.workers > db_pool.max_size:
+        parser.error(f"--workers no puede ser mayor que DB_POOL_MAX ({db_pool.max_size})")
+
+    os.makedirs(args.output, exist_ok=True)
+    app.config['DOWNLOAD_FOLDER'] = args.output
+    # Reports left in the web's downloads folder are cleaned up with the web's own
+    managed = os.path.abspath(args.output) == os.path.abspath(retention.folder)
+
+    summary = []
+    failed = False
+
+    def report_error(path, error):
+        summary.append({'file': path, 'error': str(error)})
+        if not args.json:
+            print(f"\n{path}: error: {error}", file=sys.stderr)
+
+    deduplicator = Deduplicator(args.dedup)
+    if deduplicator.needs_plan:
+        # The row kept for a DNI may be in a later file; a file that cannot be read is not imported
+        readable = []
+        for path in files:
+            try:
+                with open(path, 'rb') as source:
+                    deduplicator.plan(_read_chunks(source, args.chunk_size), path)
+                readable.append(path)
+            except Exception as e:
+                failed = True
+                report_error(path, e)
+        files = readable
+
+    for path in files:
+        name = os.path.basename(path)
+        file_id = f"{secure_filename(os.path.splitext(name)[0]) or 'csv'}-{uuid.uuid4().hex[:8]}"
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        try:
+            results = process_csv_file(path, file_id, progress_callback=None if args.json else progress_printer(name),
+                                       db_workers=args.workers, validation_workers=args.validation_workers,
+                                       incremental=args.incremental, report_format=args.format,
+                                       chunk_size=args.chunk_size, timestamp=timestamp, deduplicator=deduplicator,
+                                       dry_run=args.dry_run, db_batch_size=args.batch_size)
+        except Exception as e:
+            failed = True
+            report_error(path, e)
+            continue
+        finally:
+            if managed:
+                retention.register(file_id, report_names(file_id, timestamp, args.format))
+        failed = failed or bool(results['db_insert_errors'])
+        summary.append({'file': path, 'file_id': file_id, 'results': results})
+        if not args.json:
+            print_summary(path, results, args.output)
+
+    if args.json:
+        json.dump(summary, sys.stdout, indent=2, ensure_ascii=False, default=str)
+        print()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
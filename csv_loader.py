@@ -0,0 +1,108 @@
+import csv
+import logging
+
+import pandas as pd
+
+# Optional dependency: multithreaded Arrow CSV parser
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = pa_csv = None
+
+# pandas' default NA markers, so both parsers agree on which cells are empty
+NA_VALUES = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+             '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+
+# Bytes the Arrow reader parses at a time
+ARROW_BLOCK_SIZE = 4 * 1024 * 1024
+
+
+def _header(source):
+    """Column names from the first line, leaving the file position unchanged"""
+    start = source.tell()
+    line = source.readline()
+    source.seek(start)
+    return next(csv.reader([line.decode('utf-8-sig')], delimiter=';'), [])
+
+
+def _arrow_supported(names):
+    # pandas renames empty and repeated column names; leave those files to it
+    return pa_csv is not None and all(names) and len(set(names)) == len(names)
+
+
+def _pandas_chunks(source, chunk_size, skip_rows=0):
+    """pandas C parser, every column as text; the first skip_rows records are dropped"""
+    reader = pd.read_csv(source, sep=';', encoding='utf-8-sig', chunksize=chunk_size, dtype=str)
+    for chunk in reader:
+        if skip_rows >= len(chunk):
+            skip_rows -= len(chunk)
+            continue
+        if skip_rows:
+            chunk = chunk.iloc[skip_rows:]
+            skip_rows = 0
+        yield chunk
+
+
+def _arrow_chunks(source, chunk_size, names):
+    """Arrow streaming parser; yields DataFrames of chunk_size rows indexed like pandas chunks"""
+    reader = pa_csv.open_csv(
+        source,
+        read_options=pa_csv.ReadOptions(block_size=ARROW_BLOCK_SIZE, use_threads=True),
+        parse_options=pa_csv.ParseOptions(delimiter=';', newlines_in_values=True),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={name: pa.string() for name in names},
+            null_values=NA_VALUES,
+            strings_can_be_null=True,
+        ),
+    )
+    pending = []
+    pending_rows = 0
+    offset = 0
+    for batch in reader:
+        pending.append(batch)
+        pending_rows += batch.num_rows
+        while pending_rows >= chunk_size:
+            table = pa.Table.from_batches(pending)
+            yield _to_pandas(table.slice(0, chunk_size), offset)
+            offset += chunk_size
+            rest = table.slice(chunk_size)
+            pending, pending_rows = rest.to_batches(), rest.num_rows
+    if pending_rows:
+        yield _to_pandas(pa.Table.from_batches(pending), offset)
+
+
+def _to_pandas(table, offset):
+    df = table.to_pandas()
+    df.index = pd.RangeIndex(offset, offset + len(df))
+    return df
+
+
+def read_csv_chunks(source, chunk_size, engine='auto'):
+    """
+    Read a semicolon-separated CSV from a binary file in DataFrames of
+    chunk_size rows, with every column as text (NaN for empty cells).
+
+    engine='auto' uses the multithreaded Arrow parser when pyarrow is
+    installed and falls back to pandas for files it cannot handle, also
+    halfway through: pandas then continues from the first row Arrow did not
+    deliver. engine='pandas' always uses pandas, and so do sources that
+    cannot seek back for that fallback, like an upload still arriving.
+    """
+    if engine == 'pandas' or not source.seekable():
+        yield from _pandas_chunks(source, chunk_size)
+        return
+    names = _header(source)
+    if not _arrow_supported(names):
+        yield from _pandas_chunks(source, chunk_size)
+        return
+
+    delivered = 0
+    try:
+        for chunk in _arrow_chunks(source, chunk_size, names):
+            delivered += len(chunk)
+            yield chunk
+    except (pa.ArrowInvalid, UnicodeDecodeError) as e:
+        logging.warning(f"Arrow CSV parser failed after {delivered} rows, continuing with pandas: {str(e)}")
+        source.seek(0)
+        yield from _pandas_chunks(source, chunk_size, skip_rows=delivered)
@@ -0,0 +1,45 @@
+import logging
+import os
+import time
+
+import pymysql
+from dotenv import load_dotenv
+from pymysql.cursors import DictCursor
+
+import metrics
+
+# Scripts that only need a connection import this module without the Flask app
+load_dotenv()
+
+
+class InstrumentedCursor(DictCursor):
+    """DictCursor that records the count and round-trip time of every statement"""
+
+    def execute(self, query, args=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, args)
+        finally:
+            metrics.observe_query(time.perf_counter() - started)
+
+
+def open_database_connection(prefix='DB_'):
+    """Open a new database connection from the {prefix}HOST, {prefix}NAME... environment variables; raises on failure"""
+    return pymysql.connect(
+        host=os.getenv(f'{prefix}HOST'),
+        port=int(os.getenv(f'{prefix}PORT', 3306)),
+        user=os.getenv(f'{prefix}USER'),
+        password=os.getenv(f'{prefix}PASSWORD'),
+        database=os.getenv(f'{prefix}NAME'),
+        cursorclass=InstrumentedCursor,
+        charset='utf8mb4'
+    )
+
+
+def get_database_connection():
+    """Get database connection using environment variables"""
+    try:
+        return open_database_connection()
+    except Exception as e:
+        logging.error(f"Error connecting to database: {str(e)}")
+        return None
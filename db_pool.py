@@ -0,0 +1,222 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# pymysql.constants.SERVER_STATUS.SERVER_STATUS_IN_TRANS
+SERVER_STATUS_IN_TRANS = 1
+
+
+class PoolError(Exception):
+    """Raised when a connection cannot be created or borrowed in time"""
+
+
+class _PooledConnection:
+    __slots__ = ('connection', 'created_at', 'last_used')
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class ConnectionPool:
+    """
+    Process-wide, thread-safe pool of database connections.
+
+    - Between min_size and max_size connections are kept open.
+    - Connections idle for longer than ping_after seconds are pinged on
+      checkout and replaced if the ping fails.
+    - Connections idle for longer than idle_timeout (above min_size) or
+      older than recycle seconds are closed instead of reused.
+    - Borrowers wait up to timeout seconds when all connections are in use.
+    """
+
+    def __init__(self, factory, min_size=1, max_size=10, idle_timeout=300, recycle=3600,
+                 timeout=30, ping_after=10):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError("Invalid pool size")
+        self._factory = factory
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.recycle = recycle
+        self.timeout = timeout
+        self.ping_after = ping_after
+
+        self._idle = deque()
+        self._borrowed = {}
+        self._size = 0
+        self._in_use = 0
+        # Condition over an RLock, so helpers can re-enter it
+        self._cond = threading.Condition(threading.RLock())
+        self._stats = {
+            'checkouts': 0,
+            'created': 0,
+            'closed': 0,
+            'failed_health_checks': 0,
+            'timeouts': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+        }
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of a with block"""
+        conn = self.acquire()
+        try:
+            yield conn
+        except BaseException:
+            # State is unknown after an error escaping the block: do not reuse it
+            self.release(conn, discard=True)
+            raise
+        else:
+            self.release(conn)
+
+    def acquire(self, timeout=None):
+        """Borrow a healthy connection, creating one if the pool is not full"""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        waited = False
+
+        while True:
+            with self._cond:
+                self._prune_idle()
+                pooled = self._idle.pop() if self._idle else None
+                create = pooled is None and self._size < self.max_size
+                if pooled is None and not create:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolError(f"No free database connection after {timeout}s")
+                    waited = True
+                    self._cond.wait(remaining)
+                    continue
+                # Reserve the slot before leaving the lock
+                self._in_use += 1
+                if create:
+                    self._size += 1
+
+            if create:
+                try:
+                    pooled = _PooledConnection(self._factory())
+                except Exception as e:
+                    with self._cond:
+                        self._in_use -= 1
+                        self._size -= 1
+                        self._cond.notify()
+                    raise PoolError(f"Unable to open database connection: {str(e)}") from e
+                with self._cond:
+                    self._stats['created'] += 1
+            elif not self._healthy(pooled):
+                with self._cond:
+                    self._in_use -= 1
+                    self._size -= 1
+                    self._stats['failed_health_checks'] += 1
+                    self._cond.notify()
+                self._close(pooled)
+                continue
+
+            wait_time = time.monotonic() - started
+            with self._cond:
+                self._stats['checkouts'] += 1
+                if waited:
+                    self._stats['waits'] += 1
+                    self._stats['wait_time_total'] += wait_time
+                    self._stats['wait_time_max'] = max(self._stats['wait_time_max'], wait_time)
+                self._borrowed[id(pooled.connection)] = pooled
+            return pooled.connection
+
+    def release(self, conn, discard=False):
+        """Return a borrowed connection; open transactions are rolled back"""
+        with self._cond:
+            pooled = self._borrowed.pop(id(conn), None)
+        if pooled is None:
+            raise PoolError("Connection does not belong to this pool")
+
+        if not discard:
+            try:
+                if getattr(conn, 'server_status', SERVER_STATUS_IN_TRANS) & SERVER_STATUS_IN_TRANS:
+                    conn.rollback()
+            except Exception as e:
+                logging.warning(f"Discarding pooled connection after failed rollback: {str(e)}")
+                discard = True
+
+        now = time.monotonic()
+        if not discard and now - pooled.created_at > self.recycle:
+            discard = True
+
+        with self._cond:
+            self._in_use -= 1
+            if discard:
+                self._size -= 1
+            else:
+                pooled.last_used = now
+                self._idle.append(pooled)
+            self._cond.notify()
+        if discard:
+            self._close(pooled)
+
+    def stats(self):
+        """Snapshot of pool usage counters"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update(
+                size=self._size,
+                in_use=self._in_use,
+                idle=len(self._idle),
+                min_size=self.min_size,
+                max_size=self.max_size,
+            )
+        stats['wait_time_avg'] = stats['wait_time_total'] / stats['waits'] if stats['waits'] else 0.0
+        return stats
+
+    def close(self):
+        """Close every idle connection; borrowed ones are closed when released"""
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+        for pooled in idle:
+            self._close(pooled)
+
+    def _healthy(self, pooled):
+        if time.monotonic() - pooled.last_used < self.ping_after:
+            return True
+        try:
+            pooled.connection.ping(reconnect=False)
+            return True
+        except Exception as e:
+            logging.warning(f"Pooled connection failed health check: {str(e)}")
+            return False
+
+    def _prune_idle(self):
+        """Drop expired idle connections; caller holds the lock"""
+        now = time.monotonic()
+        kept = deque()
+        expired = []
+        # Oldest idle connections are at the left
+        while self._idle:
+            pooled = self._idle.popleft()
+            too_old = now - pooled.created_at > self.recycle
+            too_idle = now - pooled.last_used > self.idle_timeout and self._size - len(expired) > self.min_size
+            if too_old or too_idle:
+                expired.append(pooled)
+            else:
+                kept.append(pooled)
+        self._idle = kept
+        self._size -= len(expired)
+        for pooled in expired:
+            # Closing only sends COM_QUIT; cheap enough to do under the lock
+            self._close(pooled)
+
+    def _close(self, pooled):
+        try:
+            pooled.connection.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._stats['closed'] += 1
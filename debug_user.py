@@ -1,9 +1,5 @@
 #!/usr/bin/env python3
-import pymysql
-from dotenv import load_dotenv
-import os
-
-load_dotenv()
+from db import open_database_connection
 
 # Datos del usuario problemático
 dni = '69338576Q'
@@ -12,13 +8,7 @@ email = 'seidor@gmail.com'
 print(f"Verificando usuario {dni}...")
 
 try:
-    conn = pymysql.connect(
-        host=os.getenv('DB_HOST'),
-        port=int(os.getenv('DB_PORT', 3306)),
-        user=os.getenv('DB_USER'),
-        password=os.getenv('DB_PASSWORD'),
-        database=os.getenv('DB_NAME')
-    )
+    conn = open_database_connection()
 
     with conn.cursor() as cursor:
         # Buscar por login
@@ -43,7 +33,7 @@ try:
             columns = cursor.fetchall()
             print("Columnas de wp_users:")
             for col in columns:
-                print(f"  {col[0]}: {col[1]}")
+                print(f"  {col['Field']}: {col['Type']}")
 
     conn.close()
 
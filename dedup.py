@@ -0,0 +1,119 @@
+import os
+
+import pandas as pd
+
+from validators import validar_identificadores_vectorizado
+
+# Which of the rows that share a DNI is written to the database
+DEDUP_RULES = ('first', 'last', 'most_complete')
+
+
+def dni_keys(df):
+    """Normalized DNI of every row: the login it is written under, compared the way MariaDB does"""
+    return df['dni'].astype(str).str.strip().str.upper()
+
+
+def completeness(df):
+    """Number of non-empty fields of every row, as they are in the file"""
+    fields = df.astype(object).fillna('').astype(str)
+    return (fields.apply(lambda column: column.str.strip()) != '').sum(axis=1)
+
+
+class Deduplicator:
+    """
+    Keeps one row per normalized DNI among the valid rows of an import, so
+    the database writers never get the same user twice. Passing the same
+    instance to several imports also drops DNIs repeated between their files.
+
+    rule picks the row that is written:
+    - first: the first row of each DNI.
+    - last: the last row.
+    - most_complete: the row with most non-empty fields, the first one on a tie.
+
+    first needs nothing but the rows seen so far. For the other rules plan()
+    reads the file once beforehand (only the DNI is validated) to find every
+    winner, so the rows kept do not depend on the chunk size. A file that
+    cannot be read twice, such as an upload that is still arriving, is
+    deduplicated chunk by chunk instead: a better row in a later chunk is
+    then written as an update of the one already written.
+    """
+
+    def __init__(self, rule='last'):
+        if rule not in DEDUP_RULES:
+            raise ValueError(f"Unknown dedup rule: {rule}")
+        self.rule = rule
+        # DNI -> (source, row, completeness) of the row kept for it
+        self._kept = {}
+        self._planned = set()
+
+    @property
+    def needs_plan(self):
+        return self.rule != 'first'
+
+    def is_planned(self, source):
+        return source in self._planned
+
+    def _chunk_winners(self, keys, chunk):
+        """Boolean Series marking the row each DNI keeps within one chunk, and the rows' completeness"""
+        if self.rule == 'first':
+            return ~keys.duplicated(keep='first'), pd.Series(0, index=keys.index)
+        if self.rule == 'last':
+            return ~keys.duplicated(keep='last'), pd.Series(0, index=keys.index)
+        scores = completeness(chunk) if len(chunk) > 0 else pd.Series(0, index=keys.index)
+        ranked = scores.sort_values(ascending=False, kind='stable').index
+        best = ranked[~keys[ranked].duplicated().to_numpy()]
+        return pd.Series(keys.index.isin(best), index=keys.index), scores
+
+    def _offer(self, key, source, row, score):
+        """Keep the row for its DNI if the rule prefers it to the one kept so far; returns whether it did"""
+        current = self._kept.get(key)
+        if current is None or self.rule == 'last' or (self.rule == 'most_complete' and score > current[2]):
+            self._kept[key] = (source, row, score)
+            return True
+        return False
+
+    def plan(self, chunks, source=None):
+        """
+        Pick the row every DNI keeps from the raw chunks of a whole file
+        (as read by app._read_chunks, before validation). Call it once per
+        file, in the order the files are imported, before split().
+        """
+        for chunk in chunks:
+            if 'dni' not in chunk.columns:
+                continue
+            valid, _ = validar_identificadores_vectorizado(chunk['dni'])
+            chunk = chunk[valid]
+            keys = dni_keys(chunk)
+            winners, scores = self._chunk_winners(keys, chunk)
+            for row, key, score in zip(chunk.index[winners], keys[winners], scores[winners]):
+                self._offer(key, source, row, score)
+        self._planned.add(source)
+
+    def split(self, df, chunk, source=None):
+        """
+        Split the valid rows of a chunk into (kept, dropped). chunk is the raw
+        chunk they were validated from; its index is the row number in the
+        file. dropped gets a motivo_duplicado column.
+        """
+        keys = dni_keys(df) if len(df) > 0 else pd.Series(dtype=object)
+        if source in self._planned:
+            keep = pd.Series([self._kept[key][:2] == (source, row) for row, key in zip(df.index, keys)],
+                             index=df.index, dtype=bool)
+        else:
+            winners, scores = self._chunk_winners(keys, chunk.loc[df.index])
+            beaten = [row for row, key, score in zip(df.index[winners], keys[winners], scores[winners])
+                      if not self._offer(key, source, row, score)]
+            keep = winners & ~df.index.isin(beaten)
+
+        dropped = df[~keep]
+        reasons = keys[~keep].map(lambda key: self._reason(self._kept[key], source))
+        return df[keep], dropped.assign(motivo_duplicado=reasons.astype(object))
+
+    @staticmethod
+    def _reason(kept, source):
+        kept_source, row, _ = kept
+        # Row numbers as a spreadsheet shows them, with the header as row 1
+        reason = f"DNI repetido en la fila {row + 2}"
+        if kept_source != source:
+            reason += f" de {os.path.basename(kept_source)}" if kept_source else " de otro archivo"
+        return reason
@@ -0,0 +1,70 @@
+import mimetypes
+import os
+from urllib.parse import quote
+
+from flask import current_app, request, send_file
+from werkzeug.security import safe_join
+
+# How a download is handed to the web server in front of the app:
+# '' sends it from the app, 'x-sendfile' (Apache, lighttpd) and 'x-accel' (nginx) let the proxy send the file
+OFFLOAD_MODES = ('', 'x-sendfile', 'x-accel')
+
+
+def send_download(folder, filename, download_name=None, mimetype=None, content_encoding=None,
+                  max_age=0, offload='', accel_prefix='/internal-downloads/'):
+    """
+    Response that downloads folder/filename as an attachment. Raises
+    FileNotFoundError if the name is not a file inside folder.
+
+    The ETag and Last-Modified come from one stat() of the file, so a repeat
+    download with If-None-Match / If-Modified-Since gets a 304 without the
+    file being opened. Without offload, Range requests get a 206 with only
+    the missing bytes, so an interrupted download resumes where it stopped;
+    the full file goes through wsgi.file_wrapper (sendfile under gunicorn).
+    With offload the app only answers the conditional request and the proxy
+    sends the file, ranges included.
+
+    content_encoding sends a compressed file as the encoded form of another
+    type (see app.COMPRESSED_REPORT_ENCODINGS); it gets its own ETag.
+    max_age > 0 lets the browser reuse its copy for that many seconds;
+    otherwise it revalidates every time. Reports are never cached by shared proxies.
+    """
+    path = safe_join(folder, filename)
+    if path is None or not os.path.isfile(path):
+        raise FileNotFoundError(filename)
+    stat = os.stat(path)
+    download_name = download_name or filename
+    mimetype = mimetype or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    if offload == 'x-accel' and content_encoding:
+        # nginx does not keep the app's Content-Encoding on an internal redirect
+        offload = ''
+    if offload:
+        response = current_app.response_class(mimetype=mimetype)
+        response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+        if offload == 'x-accel':
+            response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + quote(filename)
+        else:
+            response.headers['X-Sendfile'] = os.path.abspath(path)
+    else:
+        response = send_file(path, mimetype=mimetype, as_attachment=True, download_name=download_name,
+                             conditional=False, etag=False)
+
+    # The same file sent with and without Content-Encoding is two different representations
+    etag = f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+    response.set_etag(f"{etag}-{content_encoding}" if content_encoding else etag)
+    response.last_modified = stat.st_mtime
+    if content_encoding:
+        response.headers['Content-Encoding'] = content_encoding
+    response.cache_control.private = True
+    response.cache_control.public = None
+    if max_age > 0:
+        response.cache_control.no_cache = None
+        response.cache_control.max_age = max_age
+    else:
+        response.cache_control.no_cache = True
+    response = response.make_conditional(request.environ, accept_ranges=not offload, complete_length=stat.st_size)
+    if response.status_code == 304:
+        # Some X-Sendfile implementations send the file anyway
+        response.headers.pop('X-Sendfile', None)
+    return response
@@ -0,0 +1,7 @@
+# Read by gunicorn from the working directory (gunicorn main:app)
+
+
+def post_worker_init(worker):
+    # In the worker that serves requests, after main:app is loaded; never in the import's child processes
+    from main import start_background_tasks
+    start_background_tasks()
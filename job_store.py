@@ -0,0 +1,122 @@
+import json
+import sqlite3
+import threading
+import time
+
+
+class JobStore:
+    """
+    Local SQLite record of every import: its upload, options, the last chunk
+    whose database writes are committed (with the totals up to it) and the
+    final results. Imports that were queued or running when the process
+    stopped are resumed from their checkpoint on the next start.
+
+    Imports also act as a result cache: content_hash (the SHA-256 of the
+    uploaded file) finds an earlier or still running import of the same file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " job_id TEXT PRIMARY KEY,"
+                " upload_path TEXT NOT NULL,"
+                " options TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " checkpoint TEXT,"
+                " results TEXT,"
+                " error TEXT,"
+                " created_at REAL NOT NULL,"
+                " updated_at REAL NOT NULL,"
+                " content_hash TEXT)"
+            )
+            # Stores created before the result cache lack the column
+            columns = [row['name'] for row in self._conn.execute("PRAGMA table_info(jobs)")]
+            if 'content_hash' not in columns:
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN content_hash TEXT")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_content_hash ON jobs (content_hash)")
+            self._conn.commit()
+
+    def _execute(self, query, args):
+        with self._lock:
+            self._conn.execute(query, args)
+            self._conn.commit()
+
+    def _set(self, job_id, **fields):
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        self._execute(f"UPDATE jobs SET {assignments}, updated_at = ? WHERE job_id = ?",
+                      (*fields.values(), time.time(), job_id))
+
+    def create(self, job_id, upload_path, options, content_hash=None):
+        """Record a queued import; options must be JSON serializable"""
+        now = time.time()
+        self._execute(
+            "INSERT INTO jobs (job_id, upload_path, options, status, created_at, updated_at, content_hash)"
+            " VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+            (job_id, upload_path, json.dumps(options), now, now, content_hash),
+        )
+
+    def set_content_hash(self, job_id, content_hash):
+        """Hash of an upload that was only known once it had arrived (see /upload-stream)"""
+        self._execute("UPDATE jobs SET content_hash = ? WHERE job_id = ?", (content_hash, job_id))
+
+    def start(self, job_id):
+        self._set(job_id, status='running')
+
+    def checkpoint(self, job_id, state):
+        """Store the progress of an import: the last committed chunk and the totals up to it"""
+        self._set(job_id, checkpoint=json.dumps(state))
+
+    def finish(self, job_id, results):
+        self._set(job_id, status='done', results=json.dumps(results, default=str))
+
+    def fail(self, job_id, error):
+        self._set(job_id, status='error', error=error)
+
+    def delete(self, job_id):
+        self._execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+    def _row_to_job(self, row):
+        job = dict(row)
+        for field in ('options', 'checkpoint', 'results'):
+            if job[field] is not None:
+                job[field] = json.loads(job[field])
+        return job
+
+    def get(self, job_id):
+        """Return the stored job as a dict, or None if it is unknown"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def unfinished(self):
+        """Jobs that were queued or running when the process stopped, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+            ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def find_by_hash(self, content_hash):
+        """Queued, running and finished imports of a file with this content hash, newest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE content_hash = ? AND status IN ('queued', 'running', 'done')"
+                " ORDER BY created_at DESC",
+                (content_hash,),
+            ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def prune(self, max_age):
+        """Forget finished jobs older than max_age seconds"""
+        self._execute("DELETE FROM jobs WHERE status IN ('done', 'error') AND updated_at < ?",
+                      (time.time() - max_age,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
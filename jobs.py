@@ -0,0 +1,129 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobRunner:
+    """
+    Runs CSV imports on a bounded pool of background threads and keeps the
+    per-phase progress counters that /progress/<file_id> reports.
+    """
+
+    def __init__(self, max_workers=2, max_pending=8, results_ttl=3600):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='import-job')
+        # One slot per running or queued job; submit() fails instead of queueing without limit
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._max_workers = max_workers
+        # Jobs submitted and not finished yet; fewer than max_workers means a worker is idle
+        self._active = 0
+        self._results_ttl = results_ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, job_id, func, *args, **kwargs):
+        """Queue func(*args, progress_callback=..., **kwargs). Returns False if the queue is full."""
+        return self._submit(job_id, func, args, kwargs, idle_only=False)
+
+    def submit_now(self, job_id, func, *args, **kwargs):
+        """Like submit(), but only if a worker is idle, so the job starts now instead of waiting in the queue"""
+        return self._submit(job_id, func, args, kwargs, idle_only=True)
+
+    def _submit(self, job_id, func, args, kwargs, idle_only):
+        with self._lock:
+            if idle_only and self._active >= self._max_workers:
+                return False
+            if not self._slots.acquire(blocking=False):
+                return False
+            self._active += 1
+
+        self._prune_finished()
+        with self._lock:
+            self._jobs[job_id] = {
+                'phase': 'queued',
+                'validation_done': 0,
+                'validation_total': 0,
+                'validation_finished': False,
+                'db_done': 0,
+                'db_total': 0,
+                'results': None,
+                'error': None,
+                'finished_at': None,
+            }
+
+        try:
+            self._executor.submit(self._run, job_id, func, args, kwargs)
+        except Exception:
+            self._release()
+            raise
+        return True
+
+    def _release(self):
+        with self._lock:
+            self._active -= 1
+        self._slots.release()
+
+    def _run(self, job_id, func, args, kwargs):
+        self.update(job_id, phase='running')
+        try:
+            results = func(*args, progress_callback=self._reporter(job_id), **kwargs)
+            self.update(job_id, phase='done', results=results, finished_at=time.time())
+        except Exception as e:
+            logging.error(f"Job {job_id} failed: {str(e)}")
+            self.update(job_id, phase='error', error=str(e), finished_at=time.time())
+        finally:
+            self._release()
+
+    def _reporter(self, job_id):
+        def report(phase, done, total):
+            # Validation and database writes overlap: each phase only updates its own counters
+            if phase == 'validation':
+                self.update(job_id, validation_done=done, validation_total=total)
+            elif phase == 'validation_done':
+                self.update(job_id, validation_done=done, validation_total=total, validation_finished=True)
+            elif phase == 'db_insert':
+                self.update(job_id, db_done=done, db_total=total)
+        return report
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def get(self, job_id):
+        """Return a snapshot of the job state, or None if the job is unknown"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def progress(self, job_id):
+        """Return the progress payload polled by templates/processing.html"""
+        job = self.get(job_id)
+        if job is None:
+            return None
+
+        def percent(done, total):
+            return min(100.0, done * 100.0 / total) if total else 0.0
+
+        # An empty file or one without valid rows has nothing to count: done is 100%
+        done = job['phase'] == 'done'
+        validation_finished = done or job['validation_finished']
+        payload = {
+            'phase': job['phase'],
+            'validation_done': job['validation_done'],
+            'validation_total': job['validation_total'],
+            'validation_finished': validation_finished,
+            'validation_percent': 100.0 if validation_finished else percent(job['validation_done'], job['validation_total']),
+            'db_done': job['db_done'],
+            'db_total': job['db_total'],
+            'db_percent': 100.0 if done else percent(job['db_done'], job['db_total']),
+        }
+        if job['error']:
+            payload['error'] = job['error']
+        return payload
+
+    def _prune_finished(self):
+        limit = time.time() - self._results_ttl
+        with self._lock:
+            for job_id in [j for j, job in self._jobs.items() if job['finished_at'] and job['finished_at'] < limit]:
+                del self._jobs[job_id]
@@ -1,4 +1,21 @@
-from app import app
+import os
+
+from app import app, retention, resume_interrupted_jobs
+
+
+def start_background_tasks():
+    """
+    Start the report cleanup thread and resume the imports a restart
+    interrupted. Only for the process that serves requests: validation
+    processes import this module again as __mp_main__ and must not run it
+    (gunicorn calls it from gunicorn.conf.py).
+    """
+    retention.start()
+    resume_interrupted_jobs()
+
 
 if __name__ == '__main__':
+    # The debug reloader runs this module twice; only the child process serves requests
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_tasks()
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,128 @@
+import logging
+import queue
+import threading
+
+_STOP = object()
+
+# How often blocked producers and consumers check whether the pipeline failed
+_POLL_SECONDS = 0.1
+
+
+class PipelineAborted(Exception):
+    """Raised in the producer when another stage has already failed"""
+
+
+class Stage:
+    """
+    A group of worker threads, each one consuming its own bounded queue.
+    consumer(items) is called once per worker with an iterator over the items
+    put for that worker; it returns when the pipeline is closed or aborted.
+    """
+
+    def __init__(self, pipeline, name, consumer, workers, queue_size):
+        self._pipeline = pipeline
+        self.name = name
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        self._threads = [
+            threading.Thread(target=self._run, args=(consumer, q), name=f"{name}-{i}", daemon=True)
+            for i, q in enumerate(self._queues)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def workers(self):
+        return len(self._queues)
+
+    def put(self, item, worker=0):
+        """Queue an item for one worker, blocking while its queue is full (backpressure)"""
+        q = self._queues[worker]
+        while True:
+            self._pipeline.check()
+            try:
+                q.put(item, timeout=_POLL_SECONDS)
+                return
+            except queue.Full:
+                continue
+
+    def _items(self, q):
+        while True:
+            try:
+                item = q.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                if self._pipeline.failed:
+                    return
+                continue
+            if item is _STOP or self._pipeline.failed:
+                return
+            yield item
+
+    def _run(self, consumer, q):
+        try:
+            consumer(self._items(q))
+        except BaseException as e:
+            logging.error(f"Pipeline stage {self.name} failed: {str(e)}")
+            self._pipeline.fail(e)
+
+    def _finish(self):
+        for q in self._queues:
+            while True:
+                try:
+                    q.put(_STOP, timeout=_POLL_SECONDS)
+                    break
+                except queue.Full:
+                    if self._pipeline.failed:
+                        break
+        for thread in self._threads:
+            thread.join()
+
+
+class Pipeline:
+    """
+    Producer/consumer pipeline with bounded queues between stages.
+
+    The calling thread is the producer: it puts items on the stages, which
+    run in their own threads. The first exception raised by any stage stops
+    the producer (its next put raises) and is re-raised when the with block
+    exits, after every thread has finished.
+    """
+
+    def __init__(self, queue_size=4):
+        self.queue_size = queue_size
+        self._stages = []
+        self._error = None
+        self._failed = threading.Event()
+        self._lock = threading.Lock()
+
+    def stage(self, name, consumer, workers=1):
+        stage = Stage(self, name, consumer, workers, self.queue_size)
+        self._stages.append(stage)
+        return stage
+
+    @property
+    def failed(self):
+        return self._failed.is_set()
+
+    def fail(self, error):
+        with self._lock:
+            if self._error is None:
+                self._error = error
+        self._failed.set()
+
+    def check(self):
+        """Raise in the producer if a stage has failed"""
+        if self._failed.is_set():
+            raise PipelineAborted(str(self._error))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and not isinstance(exc, PipelineAborted):
+            # The producer failed: stop the consumers without waiting for their queues
+            self.fail(exc)
+        for stage in self._stages:
+            stage._finish()
+        if self._error is not None and (exc_type is None or isinstance(exc, PipelineAborted)):
+            raise self._error
+        return False
@@ -0,0 +1,122 @@
+import gzip
+import io
+
+import pandas as pd
+
+# Optional dependencies: compressed CSV with zstd and Parquet output
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# Report format -> file extension
+REPORT_FORMATS = {
+    'csv': '.csv',
+    'csv.gz': '.csv.gz',
+    'csv.zst': '.csv.zst',
+    'parquet': '.parquet',
+}
+
+# Fast levels: reports are written while the import runs
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+PARQUET_COMPRESSION = 'zstd'
+
+
+def available_formats():
+    """Report formats that can be written with the installed libraries"""
+    formats = ['csv', 'csv.gz']
+    if zstandard is not None:
+        formats.append('csv.zst')
+    if pq is not None:
+        formats.append('parquet')
+    return formats
+
+
+def report_filename(name, report_format):
+    return name + REPORT_FORMATS[report_format]
+
+
+def read_report(path, report_format, chunk_size):
+    """Read a report written by ReportWriter back in DataFrames of up to chunk_size rows, as text"""
+    if report_format == 'parquet':
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas().fillna('')
+        return
+    if report_format == 'csv.gz':
+        source = gzip.open(path, 'rb')
+    elif report_format == 'csv.zst':
+        source = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    else:
+        source = open(path, 'rb')
+    with source:
+        # Empty cells stay '' as in the DataFrames the report was written from
+        yield from pd.read_csv(source, sep=';', encoding='utf-8-sig', chunksize=chunk_size, dtype=str,
+                               keep_default_na=False)
+
+
+class ReportWriter:
+    """
+    Appends DataFrame chunks to a report: a semicolon-separated CSV (plain,
+    gzip or zstd compressed) or a Parquet file with one row group per chunk.
+    The file is only created when the first non-empty chunk arrives, so
+    reports with no rows never appear in the downloads folder.
+    """
+
+    def __init__(self, path, report_format='csv'):
+        if report_format not in available_formats():
+            raise ValueError(f"Report format not available: {report_format}")
+        self.path = path
+        self.format = report_format
+        self.rows = 0
+        self._handle = None
+        self._parquet = None
+
+    def write(self, df):
+        if df.empty:
+            return
+        if self.format == 'parquet':
+            self._write_parquet(df)
+        else:
+            if self._handle is None:
+                self._handle = self._open_csv()
+            df.to_csv(self._handle, sep=';', index=False, header=self.rows == 0)
+        self.rows += len(df)
+
+    def _open_csv(self):
+        if self.format == 'csv.gz':
+            return gzip.open(self.path, 'wt', encoding='utf-8-sig', newline='', compresslevel=GZIP_LEVEL)
+        if self.format == 'csv.zst':
+            raw = open(self.path, 'wb')
+            compressed = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(raw)
+            return io.TextIOWrapper(compressed, encoding='utf-8-sig', newline='')
+        return open(self.path, 'w', encoding='utf-8-sig', newline='')
+
+    def _write_parquet(self, df):
+        # Every column is stored as text, like in the CSV reports, so chunks
+        # whose types were inferred differently still share one schema
+        if self._parquet is None:
+            schema = pa.schema([(str(column), pa.string()) for column in df.columns])
+            self._parquet = pq.ParquetWriter(self.path, schema, compression=PARQUET_COMPRESSION)
+        table = pa.Table.from_pandas(df.astype('string'), schema=self._parquet.schema, preserve_index=False)
+        self._parquet.write_table(table)
+
+    def close(self):
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+        if self._parquet is not None:
+            self._parquet.close()
+            self._parquet = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,195 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+# Report files are named {job_id}_usuarios_<kind>_<timestamp>.<ext> and zips {job_id}_informes.zip
+REPORT_MARKERS = ('_usuarios_', '_informes.zip')
+
+
+def job_id_of(name):
+    """Import a report or zip file belongs to, from its name, or None"""
+    for marker in REPORT_MARKERS:
+        # The last one: the uploaded file's name may contain the marker too
+        position = name.rfind(marker)
+        if position > 0:
+            return name[:position]
+    return None
+
+
+class RetentionManager:
+    """
+    Deletes old report files from the downloads folder in a background
+    thread. Every report and zip is registered in a SQLite index (name,
+    import, size, creation time) when it is written, so sweeps only read the
+    index and never list the folder, which can hold tens of thousands of files.
+
+    A sweep runs every interval seconds, or sooner after wake(), and applies:
+    - max_age: imports whose first report is older lose all of them.
+    - max_job_bytes: an import whose reports take more loses its zip (it can
+      be rebuilt) and then its largest reports until it fits.
+    - max_bytes: while all the reports take more, the oldest imports lose theirs.
+    A limit of 0 means no limit. Uploads are not touched: imports remove them.
+    """
+
+    def __init__(self, path, folder, max_age=0, max_bytes=0, max_job_bytes=0, interval=3600):
+        self.folder = folder
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.max_job_bytes = max_job_bytes
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            new = self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'files'"
+            ).fetchone() is None
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                " name TEXT PRIMARY KEY,"
+                " job_id TEXT NOT NULL,"
+                " bytes INTEGER NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS files_job_id ON files (job_id)")
+            self._conn.commit()
+        if new:
+            self._adopt()
+
+    def _adopt(self):
+        # A new index: register the reports already in the folder, with one scan on the first start
+        rows = []
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                job_id = job_id_of(entry.name)
+                if job_id and entry.is_file():
+                    stat = entry.stat()
+                    rows.append((entry.name, job_id, stat.st_size, stat.st_mtime))
+        self._insert(rows)
+        logging.info(f"Report index created with {len(rows)} existing files")
+
+    def _insert(self, rows):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO files (name, job_id, bytes, created_at) VALUES (?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+    def register(self, job_id, names):
+        """Record report files an import just wrote to the folder"""
+        now = time.time()
+        rows = []
+        for name in names:
+            try:
+                rows.append((name, job_id, os.path.getsize(os.path.join(self.folder, name)), now))
+            except OSError:
+                continue
+        self._insert(rows)
+
+    def files(self, job_id):
+        """Names of the indexed files of an import, sorted"""
+        with self._lock:
+            rows = self._conn.execute("SELECT name FROM files WHERE job_id = ? ORDER BY name", (job_id,)).fetchall()
+        return [name for name, in rows]
+
+    def sweep(self):
+        """Apply the limits once; returns the names of the files deleted"""
+        with self._lock:
+            rows = self._conn.execute("SELECT name, job_id, bytes, created_at FROM files").fetchall()
+        jobs = {}
+        for name, job_id, size, created_at in rows:
+            jobs.setdefault(job_id, []).append((name, size, created_at))
+        total = sum(size for _, _, size, _ in rows)
+        now = time.time()
+        doomed = []
+
+        def drop(job_id, files):
+            nonlocal total
+            for file in files:
+                jobs[job_id].remove(file)
+                doomed.append(file[0])
+                total -= file[1]
+
+        # Oldest imports first
+        order = sorted(jobs, key=lambda job_id: min(created_at for _, _, created_at in jobs[job_id]))
+        for job_id in order:
+            files = jobs[job_id]
+            if self.max_age and min(created_at for _, _, created_at in files) < now - self.max_age:
+                drop(job_id, list(files))
+                continue
+            if self.max_job_bytes:
+                job_total = sum(size for _, size, _ in files)
+                for file in sorted(files, key=lambda file: (not file[0].endswith('.zip'), -file[1])):
+                    if job_total <= self.max_job_bytes:
+                        break
+                    drop(job_id, [file])
+                    job_total -= file[1]
+        if self.max_bytes:
+            for job_id in order:
+                if total <= self.max_bytes:
+                    break
+                drop(job_id, list(jobs[job_id]))
+
+        deleted = []
+        for name in doomed:
+            try:
+                os.remove(os.path.join(self.folder, name))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                # Stays in the index and is retried on the next sweep
+                logging.warning(f"Could not delete report {name}: {str(e)}")
+                continue
+            deleted.append(name)
+        with self._lock:
+            self._conn.executemany("DELETE FROM files WHERE name = ?", [(name,) for name in deleted])
+            self._conn.commit()
+        if deleted:
+            logging.info(f"Retention: deleted {len(deleted)} report files, {total} bytes left")
+        return deleted
+
+    def stats(self):
+        with self._lock:
+            files, total, jobs = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(bytes), 0), COUNT(DISTINCT job_id) FROM files"
+            ).fetchone()
+        return {
+            'files': files,
+            'bytes': total,
+            'imports': jobs,
+            'max_age': self.max_age,
+            'max_bytes': self.max_bytes,
+            'max_job_bytes': self.max_job_bytes,
+        }
+
+    def start(self):
+        """Sweep in a background thread every interval seconds"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='report-retention', daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        """Sweep now, e.g. after an import added reports"""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sweep()
+            except Exception as e:
+                logging.error(f"Report retention sweep failed: {str(e)}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._lock:
+            self._conn.close()
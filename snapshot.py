@@ -0,0 +1,78 @@
+import hashlib
+import sqlite3
+import threading
+
+# SQLite limits the number of ? placeholders per statement
+_LOOKUP_CHUNK = 500
+
+
+def _key(dni):
+    return str(dni).strip().upper()
+
+
+def row_hash(email, telefono):
+    """Short hash of the values an import writes for a user"""
+    return hashlib.blake2b(f"{email}\x1f{telefono}".encode('utf-8'), digest_size=8).digest()
+
+
+def _user_hash(user):
+    return row_hash(str(user.get('email', '')).strip(), user.get('telefono', ''))
+
+
+class ImportSnapshot:
+    """
+    Local SQLite record of what the last successful imports wrote: one row per
+    DNI with a hash of its normalized email and phone. Incremental imports use
+    it to send only new or changed users to the database.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS users (dni TEXT PRIMARY KEY, hash BLOB NOT NULL)")
+            self._conn.commit()
+
+    def _lookup(self, keys):
+        found = {}
+        keys = list(keys)
+        with self._lock:
+            for i in range(0, len(keys), _LOOKUP_CHUNK):
+                chunk = keys[i:i + _LOOKUP_CHUNK]
+                placeholders = ', '.join(['?'] * len(chunk))
+                rows = self._conn.execute(f"SELECT dni, hash FROM users WHERE dni IN ({placeholders})", chunk)
+                found.update(rows)
+        return found
+
+    def changed(self, users):
+        """
+        Return the users (dicts with dni, email and telefono) whose values differ
+        from the snapshot, in order. A DNI repeated in the batch is compared with
+        the values of its previous occurrence, as that is what the DB will hold.
+        """
+        state = self._lookup({_key(user.get('dni', '')) for user in users})
+        changed = []
+        for user in users:
+            key = _key(user.get('dni', ''))
+            digest = _user_hash(user)
+            if state.get(key) != digest:
+                state[key] = digest
+                changed.append(user)
+        return changed
+
+    def record(self, users):
+        """Store the values of users that were committed to the database"""
+        rows = [(_key(user.get('dni', '')), _user_hash(user)) for user in users]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO users (dni, hash) VALUES (?, ?)", rows)
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
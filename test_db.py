@@ -27,13 +27,16 @@ print("Probando insercion en base de datos...")
 print(f"Datos de prueba: {len(test_users)} usuarios")
 
 try:
-    processed_count, inserted_count, updated_count, skipped_count, errors = insert_valid_users_to_db(test_users)
+    (processed_count, inserted_count, updated_count, skipped_count,
+     inserted_meta, updated_meta, errors) = insert_valid_users_to_db(test_users)
 
     print("\nResultados:")
     print(f"  Procesados: {processed_count}")
     print(f"  Insertados: {inserted_count}")
     print(f"  Actualizados: {updated_count}")
     print(f"  Saltados: {skipped_count}")
+    print(f"  Metadatos insertados: {inserted_meta}")
+    print(f"  Metadatos actualizados: {updated_meta}")
 
     if errors:
         print(f"\nErrores: {len(errors)}")
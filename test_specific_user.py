@@ -21,13 +21,16 @@ test_user = [{
 print("Probando insercion del usuario 69338576Q...")
 
 try:
-    processed_count, inserted_count, updated_count, skipped_count, errors = insert_valid_users_to_db(test_user)
+    (processed_count, inserted_count, updated_count, skipped_count,
+     inserted_meta, updated_meta, errors) = insert_valid_users_to_db(test_user)
 
     print("\nResultados:")
     print(f"  Procesados: {processed_count}")
     print(f"  Insertados: {inserted_count}")
     print(f"  Actualizados: {updated_count}")
     print(f"  Saltados: {skipped_count}")
+    print(f"  Metadatos insertados: {inserted_meta}")
+    print(f"  Metadatos actualizados: {updated_meta}")
 
     if errors:
         print(f"\nErrores: {len(errors)}")
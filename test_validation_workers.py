@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Prueba de las importaciones con VALIDATION_WORKERS=2 a través de main.py y cli.py
+
+Los procesos de validación vuelven a importar el script que arrancó la
+aplicación como __mp_main__; esto comprueba que aun así cada importación se
+lanza una sola vez. No necesita base de datos: todas las filas son inválidas.
+
+    python -m pytest test_validation_workers.py
+"""
+
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(REPO_DIR)
+
+from job_store import JobStore
+
+ROWS = 60
+CHUNK_SIZE = 10
+
+
+def write_csv(path):
+    rows = ['dni;telefono;email'] + [f'INVALIDO{i};telefono_malo;email_incorrecto' for i in range(ROWS)]
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(rows) + '\n')
+
+
+def environment(tmp_path):
+    env = dict(os.environ)
+    env.update({
+        'VALIDATION_WORKERS': '2',
+        'CSV_CHUNK_SIZE': str(CHUNK_SIZE),
+        'JOB_STORE_PATH': str(tmp_path / 'jobs.db'),
+        'SNAPSHOT_PATH': str(tmp_path / 'snapshot.db'),
+        'REPORT_INDEX_PATH': str(tmp_path / 'reports.db'),
+        'VALIDATION_CACHE_PATH': '',
+        'DB_HOST': '127.0.0.1',
+        'DB_POOL_TIMEOUT': '1',
+    })
+    return env
+
+
+def port_in_use(port):
+    with socket.socket() as s:
+        return s.connect_ex(('127.0.0.1', port)) == 0
+
+
+def test_main_resumes_interrupted_import_once(tmp_path):
+    if port_in_use(5000):
+        pytest.skip("main.py necesita el puerto 5000 libre")
+    csv_path = tmp_path / 'datos.csv'
+    write_csv(csv_path)
+    store = JobStore(str(tmp_path / 'jobs.db'))
+    store.create('job1', str(csv_path), {
+        'incremental': False, 'dry_run': False, 'report_format': 'csv', 'dedup_rule': 'first',
+        'chunk_size': CHUNK_SIZE, 'timestamp': '20260101_000000',
+    })
+
+    # The working directory gets the static/ folders the app creates
+    log_path = tmp_path / 'main.log'
+    with open(log_path, 'w') as log:
+        server = subprocess.Popen([sys.executable, os.path.join(REPO_DIR, 'main.py')], cwd=tmp_path,
+                                  env=environment(tmp_path), stdout=log, stderr=subprocess.STDOUT,
+                                  start_new_session=True)
+    try:
+        deadline = time.monotonic() + 60
+        while store.get('job1')['status'] not in ('done', 'error') and time.monotonic() < deadline:
+            time.sleep(0.2)
+        job = store.get('job1')
+    finally:
+        # The debug reloader runs the server in a child process
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait(timeout=10)
+        store.close()
+
+    log = log_path.read_text()
+    assert job['status'] == 'done', log
+    assert job['results']['total_records'] == ROWS
+    assert log.count('Resuming import job1') == 1, log
+
+
+def test_cli_imports_each_file_once(tmp_path):
+    csv_path = tmp_path / 'datos.csv'
+    write_csv(csv_path)
+    output = tmp_path / 'informes'
+
+    result = subprocess.run([sys.executable, os.path.join(REPO_DIR, 'cli.py'), str(csv_path), '--json',
+                             '--validation-workers', '2', '--chunk-size', str(CHUNK_SIZE), '--output', str(output)],
+                            cwd=tmp_path, env=environment(tmp_path), capture_output=True, text=True, timeout=120)
+
+    summary = json.loads(result.stdout)
+    assert len(summary) == 1, result.stderr
+    assert summary[0]['results']['total_records'] == ROWS
+    assert summary[0]['results']['invalid_records'] == ROWS
+    # One import, so one set of reports
+    assert {name.split('_usuarios_')[0] for name in os.listdir(output)} == {summary[0]['file_id']}
@@ -0,0 +1,153 @@
+import hashlib
+import io
+import queue
+import threading
+
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+# Bytes read from the request body at a time
+READ_SIZE = 64 * 1024
+
+# Pieces buffered between the request thread and the import; bounds memory when the import is slower
+MAX_PENDING = 64
+
+# How often a blocked uploader checks whether the import stopped reading
+_POLL_SECONDS = 0.1
+
+_EOF = object()
+
+
+class UploadAborted(Exception):
+    """Raised in the request thread when the import stopped reading the upload"""
+
+
+class UploadInterrupted(Exception):
+    """Raised in the import when the upload ended before the whole file arrived"""
+
+
+class UploadStream(io.RawIOBase):
+    """
+    Read-only binary file fed from another thread: the request thread feeds
+    the upload as it arrives and the import reads it like a file. feed()
+    blocks while MAX_PENDING pieces are waiting, so a slow import slows the
+    upload down instead of buffering it in memory.
+    """
+
+    def __init__(self, size=None, max_pending=MAX_PENDING):
+        super().__init__()
+        # Expected length in bytes, if known; used to estimate progress
+        self.size = size
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._buffer = b''
+        self._position = 0
+        self._finished = False
+        self._reader_closed = threading.Event()
+
+    # Request thread
+
+    def _put(self, item):
+        while not self._reader_closed.is_set():
+            try:
+                self._queue.put(item, timeout=_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def feed(self, data):
+        if not self._put(data):
+            raise UploadAborted("The import stopped reading the upload")
+
+    def finish(self):
+        """The whole file arrived"""
+        self._put(_EOF)
+
+    def abort(self, reason):
+        """The upload failed; the import gets UploadInterrupted on its next read"""
+        self._put(UploadInterrupted(reason))
+
+    # Import thread
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._buffer:
+            if self._finished:
+                return 0
+            item = self._queue.get()
+            if item is _EOF:
+                self._finished = True
+                return 0
+            if isinstance(item, UploadInterrupted):
+                self._finished = True
+                raise item
+            self._buffer = item
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        self._position += size
+        return size
+
+    def tell(self):
+        return self._position
+
+    def close(self):
+        self._reader_closed.set()
+        super().close()
+
+
+def iter_request_file(request, field='file', read_size=READ_SIZE):
+    """
+    Parse the body of an upload request while it arrives. Yields the name of
+    the uploaded file and then its content in pieces; yields nothing if the
+    request carries no file. Accepts multipart/form-data (the part called
+    field) or the raw CSV as body, named by the filename query parameter.
+    """
+    stream = request.stream
+    if request.mimetype != 'multipart/form-data':
+        yield request.args.get('filename', 'upload.csv')
+        while True:
+            data = stream.read(read_size)
+            if not data:
+                return
+            yield data
+
+    boundary = request.mimetype_params.get('boundary')
+    if not boundary:
+        return
+    decoder = MultipartDecoder(boundary.encode('latin-1'), max_form_memory_size=request.max_form_memory_size)
+    in_file = found = False
+    while True:
+        data = stream.read(read_size)
+        decoder.receive_data(data or None)
+        event = decoder.next_event()
+        while not isinstance(event, NeedData):
+            if isinstance(event, File) and event.name == field and not found:
+                in_file = found = True
+                yield event.filename
+            elif isinstance(event, (File, Field)):
+                in_file = False
+            elif isinstance(event, Data) and in_file and event.data:
+                yield event.data
+            elif isinstance(event, Epilogue):
+                return
+            event = decoder.next_event()
+        if not data:
+            return
+
+
+def save_upload(file, path, read_size=READ_SIZE):
+    """
+    Save an uploaded werkzeug FileStorage to path and return the SHA-256 of
+    its content, hashed while it is written instead of reading it again.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'wb') as out:
+        while True:
+            data = file.stream.read(read_size)
+            if not data:
+                break
+            digest.update(data)
+            out.write(data)
+    return digest.hexdigest()
@@ -0,0 +1,239 @@
+import logging
+import threading
+import time
+from array import array
+
+from pymysql.cursors import SSCursor
+
+PHONE_KEY = 'phone'
+
+
+def login_key(user_login):
+    """Same matching rule as app._login_key (MariaDB's case-insensitive collation)"""
+    return user_login.upper()
+
+
+class _Columns:
+    """The index data: one position per user, columns in arrays and lists"""
+
+    def __init__(self, meta_bits):
+        self.meta_bits = meta_bits
+        self.positions = {}  # login key -> position
+        self.by_id = {}  # user ID -> position
+        self.ids = array('q')
+        self.status = array('l')
+        self.emails = []
+        self.names = []
+        self.meta_masks = array('L')
+        self.phones = []
+        self.last_user_id = 0
+        self.last_meta_id = 0
+
+    def add_user(self, user_id, user_login, email, display_name, status, replace=False):
+        # Like fetch_existing_users, the lowest ID wins for a repeated login
+        key = login_key(user_login)
+        position = self.positions.get(key)
+        if position is None:
+            position = len(self.ids)
+            self.positions[key] = position
+            self.by_id[user_id] = position
+            self.ids.append(user_id)
+            self.status.append(status)
+            self.emails.append(email)
+            self.names.append(display_name)
+            self.meta_masks.append(0)
+            self.phones.append(None)
+        elif replace:
+            self.status[position] = status
+            self.emails[position] = email
+            self.names[position] = display_name
+
+    def add_meta(self, user_id, meta_key, meta_value, first_wins=False):
+        # Like fetch_user_meta, the first row of a key wins when scanning
+        position = self.by_id.get(user_id)
+        if position is None:
+            return
+        bit = self.meta_bits[meta_key]
+        if first_wins and self.meta_masks[position] & bit:
+            return
+        self.meta_masks[position] |= bit
+        if meta_key == PHONE_KEY:
+            self.phones[position] = meta_value
+
+    def add_scanned(self, users, meta):
+        # Only scans move last_user_id / last_meta_id: a user the site created
+        # with a lower ID than one an import just wrote must still be read
+        for row in users:
+            self.add_user(*row)
+            self.last_user_id = max(self.last_user_id, row[0])
+        for umeta_id, user_id, meta_key, meta_value in meta:
+            self.add_meta(user_id, meta_key, meta_value, first_wins=True)
+            self.last_meta_id = max(self.last_meta_id, umeta_id)
+
+
+class UserIndex:
+    """
+    In-memory copy of what imports compare against: for every wp_users row,
+    login -> (ID, email, display name, status), plus which of the default
+    meta keys the user has and its phone.
+
+    The first refresh() loads everything with one unbuffered scan (SSCursor)
+    per table. Later calls only read rows with a higher ID / umeta_id than
+    the last one seen, so users created since, by an import or by the site,
+    are always known. Imports record their own writes through transaction().
+    Changes the site makes to existing users or meta, and deletions, only
+    show up after the full reload every max_age seconds.
+    """
+
+    def __init__(self, connection_factory, meta_keys, max_age=900):
+        # connection_factory() is a context manager yielding a DB connection (db_pool.connection)
+        self._connection_factory = connection_factory
+        self.meta_keys = list(meta_keys)
+        self.max_age = max_age
+        self._meta_bits = {key: 1 << i for i, key in enumerate(self.meta_keys)}
+        self._columns = _Columns(self._meta_bits)
+        self.loaded_at = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def refresh(self, connection=None):
+        """
+        Load the index, or only the rows added since the last refresh; a full
+        reload after max_age. Reads with connection if given (a DB writer's own,
+        so it never waits for a second one from the pool) and ends its read
+        transaction; otherwise borrows one from connection_factory.
+        """
+        with self._refresh_lock:
+            if connection is None:
+                with self._connection_factory() as connection:
+                    self._refresh(connection)
+            else:
+                try:
+                    self._refresh(connection)
+                finally:
+                    connection.rollback()
+
+    def _refresh(self, connection):
+        if self.loaded_at is None or time.monotonic() - self.loaded_at > self.max_age:
+            self._load(connection)
+            return
+        users = list(self._scan_users(connection, self._columns.last_user_id))
+        meta = list(self._scan_meta(connection, self._columns.last_meta_id))
+        with self._lock:
+            self._columns.add_scanned(users, meta)
+
+    def _load(self, connection):
+        # Stream both tables into new columns and swap them in, so lookups never wait for the scan
+        started = time.perf_counter()
+        columns = _Columns(self._meta_bits)
+        columns.add_scanned(self._scan_users(connection, 0), ())
+        columns.add_scanned((), self._scan_meta(connection, 0))
+        with self._lock:
+            self._columns = columns
+            self.loaded_at = time.monotonic()
+        logging.info(f"User index loaded: {len(columns.positions)} users in {time.perf_counter() - started:.2f}s")
+
+    def _scan_users(self, connection, after_id):
+        with connection.cursor(SSCursor) as cursor:
+            cursor.execute("""
+                SELECT ID, user_login, user_email, display_name, user_status
+                FROM wp_users
+                WHERE ID > %s
+                ORDER BY ID
+            """, (after_id,))
+            yield from cursor
+
+    def _scan_meta(self, connection, after_id):
+        placeholders = ', '.join(['%s'] * len(self.meta_keys))
+        with connection.cursor(SSCursor) as cursor:
+            cursor.execute(f"""
+                SELECT umeta_id, user_id, meta_key, meta_value
+                FROM wp_usermeta
+                WHERE umeta_id > %s AND meta_key IN ({placeholders})
+                ORDER BY umeta_id
+            """, [after_id] + self.meta_keys)
+            yield from cursor
+
+    def users(self, logins):
+        """Rows of the given logins that exist, shaped like fetch_existing_users: {login key: row}"""
+        found = {}
+        with self._lock:
+            columns = self._columns
+            for login in logins:
+                key = login_key(login)
+                position = columns.positions.get(key)
+                if position is not None:
+                    found[key] = {
+                        'ID': columns.ids[position],
+                        'user_email': columns.emails[position],
+                        'display_name': columns.names[position],
+                        'user_status': columns.status[position],
+                    }
+        return found
+
+    def meta(self, user_ids):
+        """Default meta keys of the given users, shaped like fetch_user_meta; only the phone has a value"""
+        found = {}
+        with self._lock:
+            columns = self._columns
+            for user_id in user_ids:
+                position = columns.by_id.get(user_id)
+                mask = columns.meta_masks[position] if position is not None else 0
+                if mask:
+                    found[user_id] = {
+                        key: (columns.phones[position] if key == PHONE_KEY else None)
+                        for key, bit in self._meta_bits.items() if mask & bit
+                    }
+        return found
+
+    def get(self, user_login):
+        """Everything known about one login, with its phone, or None"""
+        row = self.users([user_login]).get(login_key(user_login))
+        if row is not None:
+            row['phone'] = self.meta([row['ID']]).get(row['ID'], {}).get(PHONE_KEY)
+        return row
+
+    def transaction(self):
+        return IndexTransaction(self)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'users': len(self._columns.positions),
+                'last_user_id': self._columns.last_user_id,
+                'last_meta_id': self._columns.last_meta_id,
+                'age_seconds': round(time.monotonic() - self.loaded_at, 1) if self.loaded_at is not None else None,
+                'max_age': self.max_age,
+            }
+
+
+class IndexTransaction:
+    """
+    Lookups against a UserIndex plus the writes of one database transaction,
+    which only reach the index when apply() is called after the commit.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self._users = []
+        self._meta = []
+
+    def users(self, logins):
+        return self.index.users(logins)
+
+    def meta(self, user_ids):
+        return self.index.meta(user_ids)
+
+    def record_user(self, user_id, user_login, email, display_name, status=0):
+        self._users.append((user_id, user_login, email, display_name, status))
+
+    def record_meta(self, user_id, meta_key, meta_value):
+        self._meta.append((user_id, meta_key, meta_value))
+
+    def apply(self):
+        index = self.index
+        with index._lock:
+            for row in self._users:
+                index._columns.add_user(*row, replace=True)
+            for row in self._meta:
+                index._columns.add_meta(*row)
@@ -1,7 +1,171 @@
+import numpy as np
 import pandas as pd
 import re
 from email_validator import validate_email, EmailNotValidError
 import logging
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Este módulo está en el camino crítico de cada importación: los patrones se
+# compilan una sola vez y las funciones no escriben logs ni en consola por fila.
+
+LETRAS_DNI = "TRWAGMYFPDXBNJZSQVHLCKE"
+LETRAS_CONTROL_CIF = "JABCDEFGHI"
+EMAIL_POR_DEFECTO = "arabat@arabat.com"
+
+PATRON_DNI = r'\d{8}[A-Z]'
+PATRON_NIE = r'[XYZ]\d{7}[A-Z]'
+PATRON_CIF = r'[ABCDEFGHJKLMNPQRSUVW]\d{7}[0-9A-J]'
+PATRON_EMAIL = r"^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$"
+PATRON_DELIMITADORES = r"[\/\-;,\s]+"
+# Literales que float() acepta en limpiar_y_elegir_telefono ('606006606.0', '6.06e8')
+PATRON_NUMERO = r"[+]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?"
+PATRON_DECIMAL = r"[+]?[0-9]+(?:\.[0-9]*)?"
+PATRON_PARTE_ENTERA = r"^[+]?([0-9]+)"
+
+REGEX_DNI = re.compile(PATRON_DNI)
+REGEX_NIE = re.compile(PATRON_NIE)
+REGEX_CIF = re.compile(PATRON_CIF)
+REGEX_EMAIL = re.compile(PATRON_EMAIL)
+REGEX_DELIMITADORES = re.compile(PATRON_DELIMITADORES)
+REGEX_NO_DIGITOS = re.compile(r"\D")
+
+
+class CacheLRU:
+    """
+    Caché LRU acotada y segura entre hilos para resultados de validación.
+    Con tamano_maximo=0 no guarda nada. Cuenta aciertos y fallos.
+    """
+
+    def __init__(self, tamano_maximo=100000):
+        self.tamano_maximo = tamano_maximo
+        self.aciertos = 0
+        self.fallos = 0
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave):
+        """Devuelve el valor guardado para clave, o None si no está"""
+        return self.obtener_varios([clave])[0]
+
+    def obtener_varios(self, claves):
+        """Busca varias claves tomando el lock una sola vez"""
+        resultados = []
+        with self._lock:
+            for clave in claves:
+                valor = self._datos.get(clave)
+                if valor is None:
+                    self.fallos += 1
+                else:
+                    self._datos.move_to_end(clave)
+                    self.aciertos += 1
+                resultados.append(valor)
+        return resultados
+
+    def guardar(self, clave, valor):
+        self.guardar_varios([(clave, valor)])
+
+    def guardar_varios(self, pares):
+        if self.tamano_maximo <= 0:
+            return
+        with self._lock:
+            for clave, valor in pares:
+                self._datos[clave] = valor
+                self._datos.move_to_end(clave)
+            while len(self._datos) > self.tamano_maximo:
+                self._datos.popitem(last=False)
+
+    def redimensionar(self, tamano_maximo):
+        with self._lock:
+            self.tamano_maximo = tamano_maximo
+            while len(self._datos) > max(tamano_maximo, 0):
+                self._datos.popitem(last=False)
+
+    def elementos(self):
+        """Copia de los pares (clave, valor), del menos al más usado"""
+        with self._lock:
+            return list(self._datos.items())
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                'size': len(self._datos),
+                'max_size': self.tamano_maximo,
+                'hits': self.aciertos,
+                'misses': self.fallos,
+                'hit_rate': self.aciertos / consultas if consultas else 0.0,
+            }
+
+
+# Una caché por validador, compartidas por las funciones escalares y vectorizadas.
+# Las claves son la entrada normalizada (texto sin espacios; en mayúsculas para identificadores).
+cache_identificadores = CacheLRU()
+cache_telefonos = CacheLRU()
+cache_emails = CacheLRU()
+
+CACHES = {
+    'identificadores': cache_identificadores,
+    'telefonos': cache_telefonos,
+    'emails': cache_emails,
+}
+
+_lock_fichero_cache = threading.Lock()
+
+
+def configurar_caches(tamano_maximo, ruta=None):
+    """Fija el tamaño de las cachés y, si existe el fichero ruta, las precarga"""
+    for cache in CACHES.values():
+        cache.redimensionar(tamano_maximo)
+    if ruta and os.path.exists(ruta):
+        cargar_caches(ruta)
+
+
+def cargar_caches(ruta):
+    """Carga en las cachés los resultados guardados con guardar_caches"""
+    try:
+        with open(ruta, encoding='utf-8') as f:
+            datos = json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Could not load validation cache {ruta}: {str(e)}")
+        return
+    for nombre, cache in CACHES.items():
+        # JSON no distingue listas de tuplas; los validadores devuelven tuplas
+        cache.guardar_varios(
+            (clave, tuple(valor) if isinstance(valor, list) else valor)
+            for clave, valor in datos.get(nombre, [])
+        )
+
+
+def guardar_caches(ruta):
+    """Guarda el contenido de las cachés en ruta (JSON, escritura atómica)"""
+    datos = {nombre: cache.elementos() for nombre, cache in CACHES.items()}
+    with _lock_fichero_cache:
+        directorio = os.path.dirname(os.path.abspath(ruta))
+        fd, temporal = tempfile.mkstemp(dir=directorio, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(datos, f, ensure_ascii=False)
+            os.replace(temporal, ruta)
+        except BaseException:
+            os.unlink(temporal)
+            raise
+
+
+def estadisticas_caches():
+    return {nombre: cache.estadisticas() for nombre, cache in CACHES.items()}
+
+
+def _cacheado(cache, clave, funcion):
+    resultado = cache.obtener(clave)
+    if resultado is None:
+        resultado = funcion(clave)
+        cache.guardar(clave, resultado)
+    return resultado
+
 
 def validar_identificador(identificador):
     """
@@ -9,31 +173,31 @@ def validar_identificador(identificador):
     Devuelve una tupla (es_valido, mensaje_error).
     """
     identificador = str(identificador).strip().upper()
+    return _cacheado(cache_identificadores, identificador, _validar_identificador_normalizado)
 
-    if re.fullmatch(r'\d{8}[A-Z]', identificador):
+def _validar_identificador_normalizado(identificador):
+    if REGEX_DNI.fullmatch(identificador):
         return validar_dni(identificador)
-    elif re.fullmatch(r'[XYZ]\d{7}[A-Z]', identificador):
+    elif REGEX_NIE.fullmatch(identificador):
         return validar_nie(identificador)
-    elif re.fullmatch(r'[ABCDEFGHJKLMNPQRSUVW]\d{7}[0-9A-J]', identificador):
+    elif REGEX_CIF.fullmatch(identificador):
         return validar_cif(identificador)
     else:
         return False, "Formato inválido para DNI/NIE/CIF"
 
 def validar_dni(dni):
-    letras_dni = "TRWAGMYFPDXBNJZSQVHLCKE"
     numero = int(dni[:-1])
     letra = dni[-1]
-    letra_calculada = letras_dni[numero % 23]
+    letra_calculada = LETRAS_DNI[numero % 23]
     if letra == letra_calculada:
         return True, ""
     return False, f"Letra de control incorrecta (esperado: {letra_calculada})"
 
 def validar_nie(nie):
-    letras_dni = "TRWAGMYFPDXBNJZSQVHLCKE"
     prefijo = {'X': '0', 'Y': '1', 'Z': '2'}
     numero = int(prefijo[nie[0]] + nie[1:-1])
     letra = nie[-1]
-    letra_calculada = letras_dni[numero % 23]
+    letra_calculada = LETRAS_DNI[numero % 23]
     if letra == letra_calculada:
         return True, ""
     return False, f"Letra de control incorrecta (esperado: {letra_calculada})"
@@ -47,7 +211,7 @@ def validar_cif(cif):
     suma_impares = sum(sum(int(d) for d in str(int(numeros[i]) * 2)) for i in range(0, 7, 2))
     total = suma_pares + suma_impares
     control_num = (10 - (total % 10)) % 10
-    control_letras = "JABCDEFGHI"
+    control_letras = LETRAS_CONTROL_CIF
 
     if letra_inicio in "PQRSNW":
         esperado = control_letras[control_num]
@@ -69,9 +233,11 @@ def limpiar_y_elegir_telefono(telefono_str):
     """
     if pd.isna(telefono_str):
         return ""
-    
+    return _cacheado(cache_telefonos, str(telefono_str).strip(), _limpiar_telefono_normalizado)
+
+def _limpiar_telefono_normalizado(telefono_str):
     # Split by common delimiters: / - ; , spaces
-    candidatos = re.split(r"[\/\-;,\s]+", str(telefono_str).strip())
+    candidatos = REGEX_DELIMITADORES.split(telefono_str)
     
     # Clean and classify numbers
     moviles = []
@@ -85,7 +251,7 @@ def limpiar_y_elegir_telefono(telefono_str):
         try:
             clean_num = str(int(float(num)))
         except ValueError:
-            clean_num = re.sub(r"\D", "", num)
+            clean_num = REGEX_NO_DIGITOS.sub("", num)
         if len(clean_num) == 9:
             if clean_num.startswith(('6', '7')):
                 moviles.append(clean_num)
@@ -128,34 +294,288 @@ def validar_email_Regex(email_str):
     Devuelve:
         (es_valido, mensaje_error, email_normalizado, email_original)
     """
-    EMAIL_REGEX = re.compile(r"^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$")
-
     if pd.isna(email_str) or str(email_str).strip() == "":
-        print("Email vacío")
-        logging.info("Email vacío")
-        return False, "Email vacío", "arabat@arabat.com", "null"
-    
-    email_str = str(email_str).strip()
+        return False, "Email vacío", EMAIL_POR_DEFECTO, "null"
+
+    return _cacheado(cache_emails, str(email_str).strip(), _validar_email_normalizado)
+
+def _validar_email_normalizado(email_str):
     email_original = email_str # Guardamos el email original para devolverlo
 
     # Split by common delimiters: / - ; , spaces
-    candidatos = re.split(r"[\/\-;,\s]+", str(email_str).strip())
+    candidatos = REGEX_DELIMITADORES.split(email_str)
 
     if len(candidatos) > 1:
         # Si hay más de un candidato, tomamos el primero
         email_str = candidatos[0]
         for email in candidatos:
-            if EMAIL_REGEX.fullmatch(email):
+            if REGEX_EMAIL.fullmatch(email):
                 email_str = email
                 break
             email_str = email
 
 
-    if not EMAIL_REGEX.fullmatch(email_str):
+    if not REGEX_EMAIL.fullmatch(email_str):
         mail = email_str.upper()
         if "Ñ" in mail:
-            return False, "Ñ no es un carácter válido en correos electrónicos", "arabat@arabat.com", email_original
+            return False, "Ñ no es un carácter válido en correos electrónicos", EMAIL_POR_DEFECTO, email_original
 
-        return False, "Formato de email inválido", "arabat@arabat.com", email_original
+        return False, "Formato de email inválido", EMAIL_POR_DEFECTO, email_original
     else: 
         return True, "", email_str, email_original
+
+
+
+# Validación vectorizada (columna a columna)
+#
+# Equivalentes de las funciones anteriores que operan sobre Series completas con
+# operaciones de texto de pandas y aritmética de NumPy, para no recorrer el
+# DataFrame fila a fila. Los motivos de error son exactamente los mismos.
+
+_LETRAS_DNI_ARRAY = np.array(list(LETRAS_DNI), dtype=object)
+_LETRAS_CONTROL_CIF_ARRAY = np.array(list(LETRAS_CONTROL_CIF), dtype=object)
+
+
+def _como_texto(serie):
+    """Convierte una Serie a texto con la misma semántica que str(valor)."""
+    return serie.astype(object).map(str).astype(object)
+
+
+def _resolver_con_cache(cache, claves, calcular):
+    """
+    Devuelve (codigos, resultados): resultados tiene un elemento por clave distinta
+    y codigos indica cuál corresponde a cada fila. calcular recibe una Serie con
+    las claves que no estaban en la caché y devuelve sus resultados en orden.
+    """
+    codigos, unicas = pd.factorize(claves.to_numpy(dtype=object))
+    resultados = cache.obtener_varios(unicas)
+    faltan = [i for i, valor in enumerate(resultados) if valor is None]
+    if faltan:
+        nuevos = calcular(pd.Series(unicas[faltan], dtype=object))
+        for i, valor in zip(faltan, nuevos):
+            resultados[i] = valor
+        cache.guardar_varios(zip(unicas[faltan], nuevos))
+    return codigos, resultados
+
+
+def validar_identificadores_vectorizado(serie):
+    """
+    Versión vectorizada de validar_identificador.
+    Devuelve (validos, motivos): una Serie booleana y una Serie con el mensaje
+    de error ("" para los identificadores válidos).
+    """
+    ids = _como_texto(serie).str.strip().str.upper()
+    codigos, resultados = _resolver_con_cache(cache_identificadores, ids, _calcular_identificadores)
+    validos = np.array([valido for valido, _ in resultados], dtype=bool)
+    motivos = np.array([motivo for _, motivo in resultados], dtype=object)
+    return (pd.Series(validos[codigos], index=serie.index),
+            pd.Series(motivos[codigos], index=serie.index, dtype=object))
+
+
+def _calcular_identificadores(ids):
+    """Valida identificadores ya normalizados; devuelve una lista de (es_valido, motivo)"""
+    validos = pd.Series(False, index=ids.index)
+    motivos = pd.Series("Formato inválido para DNI/NIE/CIF", index=ids.index, dtype=object)
+
+    es_dni = ids.str.fullmatch(PATRON_DNI, na=False).astype(bool)
+    es_nie = ids.str.fullmatch(PATRON_NIE, na=False).astype(bool)
+    es_cif = ids.str.fullmatch(PATRON_CIF, na=False).astype(bool)
+
+    # DNI y NIE: letra de control = número módulo 23
+    con_letra = es_dni | es_nie
+    if con_letra.any():
+        ids_letra = ids[con_letra]
+        nie = es_nie[con_letra]
+        numeros = np.where(
+            nie,
+            ids_letra.str[0].map({'X': 0, 'Y': 1, 'Z': 2}).fillna(0).astype('int64') * 10**7
+            + ids_letra.str[1:-1].where(nie, '0').astype('int64'),
+            ids_letra.str[:-1].where(~nie, '0').astype('int64'),
+        )
+        letra_calculada = pd.Series(_LETRAS_DNI_ARRAY[numeros % 23], index=ids_letra.index)
+        correcta = ids_letra.str[-1] == letra_calculada
+        validos[con_letra] = correcta
+        motivos[con_letra] = np.where(
+            correcta, "", "Letra de control incorrecta (esperado: " + letra_calculada + ")"
+        )
+
+    # CIF: suma de posiciones pares + suma de dígitos del doble de las impares
+    if es_cif.any():
+        cif = ids[es_cif]
+        digitos = np.column_stack([cif.str[i].astype('int64').to_numpy() for i in range(1, 8)])
+        suma_pares = digitos[:, [1, 3, 5]].sum(axis=1)
+        dobles = digitos[:, [0, 2, 4, 6]] * 2
+        suma_impares = (dobles // 10 + dobles % 10).sum(axis=1)
+        control_num = (10 - (suma_pares + suma_impares) % 10) % 10
+
+        letra_esperada = pd.Series(_LETRAS_CONTROL_CIF_ARRAY[control_num], index=cif.index)
+        digito_esperado = pd.Series(control_num.astype(str).astype(object), index=cif.index)
+        inicio = cif.str[0]
+        control = cif.str[-1]
+
+        solo_letra = inicio.isin(list("PQRSNW"))
+        solo_digito = inicio.isin(list("ABEH"))
+        ok_letra = control == letra_esperada
+        ok_digito = control == digito_esperado
+        correcto = np.select([solo_letra, solo_digito], [ok_letra, ok_digito], ok_letra | ok_digito)
+        motivo = np.select(
+            [solo_letra, solo_digito],
+            [
+                "Letra de control CIF incorrecta (esperado: " + letra_esperada + ")",
+                "Dígito de control CIF incorrecto (esperado: " + digito_esperado + ")",
+            ],
+            "Control CIF incorrecto (esperado: " + digito_esperado + " o " + letra_esperada + ")",
+        )
+        validos[es_cif] = correcto
+        motivos[es_cif] = np.where(correcto, "", motivo)
+
+    return list(zip(validos.tolist(), motivos.tolist()))
+
+
+def limpiar_telefonos_vectorizado(serie):
+    """
+    Versión vectorizada de limpiar_y_elegir_telefono.
+    Devuelve una Serie con el primer móvil de cada celda, o el primer fijo si no
+    hay móvil, o "" si no hay ningún número válido.
+    """
+    resultado = np.full(len(serie), "", dtype=object)
+    presentes = serie.notna().to_numpy()
+    if not presentes.any():
+        return pd.Series(resultado, index=serie.index)
+
+    textos = _como_texto(serie[presentes]).str.strip()
+    codigos, resultados = _resolver_con_cache(cache_telefonos, textos, _calcular_telefonos)
+    resultado[presentes] = np.array(resultados, dtype=object)[codigos]
+    return pd.Series(resultado, index=serie.index)
+
+
+def _calcular_telefonos(textos):
+    """Limpia teléfonos ya normalizados; devuelve una lista con el número elegido de cada uno"""
+    limpios_presentes = np.full(len(textos), "", dtype=object)
+
+    # Caso habitual: la celda ya es un único número de 9 cifras
+    directos = textos.str.fullmatch(r"[6789]\d{8}", na=False).astype(bool).to_numpy()
+    limpios_presentes[directos] = textos[directos].to_numpy(dtype=object)
+    textos = textos[~directos]
+
+    candidatos = textos.str.split(PATRON_DELIMITADORES, regex=True).explode().str.strip()
+    candidatos = candidatos[candidatos.notna() & (candidatos != "")]
+
+    # Los literales numéricos se normalizan como int(float(num)); el resto,
+    # quitando todo lo que no sea dígito
+    limpios = candidatos.str.replace(r"\D", "", regex=True)
+    numericos = candidatos.str.fullmatch(PATRON_NUMERO, na=False).astype(bool)
+
+    # En notación decimal ("612345678", "612345678.0") la parte entera sin
+    # ceros a la izquierda es exactamente int(float(num)), sin pasar por float
+    decimales = numericos & candidatos.str.fullmatch(PATRON_DECIMAL, na=False).astype(bool)
+    if decimales.any():
+        enteros = candidatos[decimales].str.extract(PATRON_PARTE_ENTERA, expand=False).str.lstrip("0")
+        limpios[decimales] = enteros.where(enteros.str.len() == 9, "")
+        numericos &= ~decimales
+
+    # Solo quedan los de notación científica ("6.12345678e8")
+    if numericos.any():
+        valores = np.trunc(pd.to_numeric(candidatos[numericos]).to_numpy(dtype=float))
+        nueve_digitos = (valores >= 1e8) & (valores < 1e9)
+        limpios[numericos] = np.where(
+            nueve_digitos, np.where(nueve_digitos, valores, 0).astype('int64').astype(str), ""
+        )
+
+    longitud_ok = limpios.str.len() == 9
+    primera_cifra = limpios.str[:1]
+    moviles = limpios[longitud_ok & primera_cifra.isin(['6', '7'])].groupby(level=0).first()
+    fijos = limpios[longitud_ok & primera_cifra.isin(['8', '9'])].groupby(level=0).first()
+    elegidos = moviles.combine_first(fijos)
+
+    limpios_presentes[elegidos.index.to_numpy(dtype='int64')] = elegidos.to_numpy(dtype=object)
+    return limpios_presentes.tolist()
+
+
+def validar_emails_vectorizado(serie):
+    """
+    Versión vectorizada de validar_email_Regex.
+    Devuelve un DataFrame con las columnas valido, motivo, normalizado y original,
+    equivalentes a la tupla que devuelve la función escalar.
+    """
+    total = len(serie)
+    valido = np.zeros(total, dtype=bool)
+    motivo = np.full(total, "Email vacío", dtype=object)
+    normalizado = np.full(total, EMAIL_POR_DEFECTO, dtype=object)
+    original = np.full(total, "null", dtype=object)
+
+    textos = _como_texto(serie).str.strip()
+    no_vacios = (serie.notna() & (textos != "")).to_numpy()
+    if no_vacios.any():
+        codigos, resultados = _resolver_con_cache(cache_emails, textos[no_vacios], _calcular_emails)
+        columnas = list(zip(*resultados))
+        valido[no_vacios] = np.array(columnas[0], dtype=bool)[codigos]
+        motivo[no_vacios] = np.array(columnas[1], dtype=object)[codigos]
+        normalizado[no_vacios] = np.array(columnas[2], dtype=object)[codigos]
+        original[no_vacios] = np.array(columnas[3], dtype=object)[codigos]
+
+    return pd.DataFrame(
+        {'valido': valido, 'motivo': motivo, 'normalizado': normalizado, 'original': original},
+        index=serie.index,
+    )
+
+
+def _calcular_emails(textos):
+    """
+    Valida emails ya normalizados (no vacíos); devuelve una lista de tuplas
+    (es_valido, motivo, email_normalizado, email_original)
+    """
+    elegidos = textos.copy()
+
+    # Con varios candidatos se toma el primero con formato válido, o el último
+    con_varios = textos.str.contains(PATRON_DELIMITADORES, regex=True, na=False).astype(bool)
+    if con_varios.any():
+        candidatos = textos[con_varios].str.split(PATRON_DELIMITADORES, regex=True).explode()
+        coincide = candidatos.str.fullmatch(PATRON_EMAIL, na=False).astype(bool)
+        primero_valido = candidatos[coincide].groupby(level=0).first()
+        ultimo = candidatos.groupby(level=0).last()
+        elegidos[con_varios] = primero_valido.combine_first(ultimo)
+
+    ok = elegidos.str.fullmatch(PATRON_EMAIL, na=False).astype(bool).to_numpy()
+    con_enye = elegidos.str.upper().str.contains("Ñ", regex=False, na=False).astype(bool).to_numpy()
+
+    motivo = np.where(
+        ok, "",
+        np.where(con_enye, "Ñ no es un carácter válido en correos electrónicos", "Formato de email inválido"),
+    )
+    normalizado = np.where(ok, elegidos.to_numpy(dtype=object), EMAIL_POR_DEFECTO)
+    return list(zip(ok.tolist(), motivo.tolist(), normalizado.tolist(), textos.tolist()))
+
+
+def validar_dataframe(df):
+    """
+    Valida todas las filas de un DataFrame a la vez.
+    Devuelve (df_validos, df_no_validos, df_warnings) con las mismas columnas y
+    los mismos textos de motivo_invalido / motivo_warning que la validación fila a fila.
+    """
+    df = df.copy(deep=False)
+    vacia = pd.Series("", index=df.index, dtype=object)
+
+    df['old_user'] = 1
+    df['telefono'] = limpiar_telefonos_vectorizado(df['telefono'] if 'telefono' in df.columns else vacia)
+
+    dni_valido, motivo_dni = validar_identificadores_vectorizado(df['dni'] if 'dni' in df.columns else vacia)
+
+    emails = validar_emails_vectorizado(df['email'] if 'email' in df.columns else vacia)
+    df['email'] = emails['normalizado']
+    email_valido = emails['valido']
+
+    df_validos = df[dni_valido]
+
+    con_warning = dni_valido & ~email_valido
+    df_warnings = df[con_warning].assign(
+        email_original=emails['original'][con_warning],
+        motivo_warning="Email: " + emails['motivo'][con_warning],
+    )
+
+    no_valido = ~dni_valido
+    motivo_invalido = "DNI: " + motivo_dni
+    motivo_invalido = motivo_invalido.where(email_valido, motivo_invalido + "; Email: " + emails['motivo'])
+    df_no_validos = df[no_valido].assign(motivo_invalido=motivo_invalido[no_valido])
+
+    return df_validos, df_no_validos, df_warnings